@@ -1,491 +1,229 @@
 import pygame
 from sys import exit
-import os
+import argparse
+import time
 
-pygame.init()
+import instrument
+from assets import PieceAtlas
+from book import OpeningBook
+from engine import Searcher
+from pgn import Game, write_game
+from rules import BOARD_SIZE, START_FEN, Position, square, square_pos
+from tablebase import Tablebase
 
 # Game constants
 SCREEN_SIZE = 600
+MIN_SQUARE_SIZE = 20
 SCREEN_TITLE = "Xadrez"
-BOARD_SIZE = 8
-SQUARE_SIZE = SCREEN_SIZE / BOARD_SIZE
 BOARD_COLOR_1 = (240, 217, 181)
 BOARD_COLOR_2 = (181, 136, 99)
 HIGHLIGHT_COLOR = (186, 202, 68)
 MOVE_INDICATOR_COLOR = (119, 149, 86)
+BOOK_MOVE_COLOR = (66, 133, 244)
+CHECK_COLOR = (255, 0, 0)
+CAPTURE_COLOR = (0, 255, 0)
+FPS = 30
+STATS_LINES = 12
+BOARD_POSITIONS = [(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
 
 class ChessGame:
-    def __init__(self):
-        """Initialize the chess game."""
-        self.screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE))
+    def __init__(self, computer=None, think_ms=1000, fen=START_FEN, save_pgn=None, book=None, tablebase=None):
+        """Initialize the chess game; computer is the color ('b' or 'p') played by the engine, if any.
+
+        The game starts from fen and, when save_pgn is a path, is appended to
+        that PGN file on quit. With a book path, opening book moves of the
+        selected piece are marked and the computer plays from the book first.
+        With a tablebase directory, forced results of small endings are
+        announced in the window title after every move.
+        """
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE), pygame.RESIZABLE)
         pygame.display.set_caption(SCREEN_TITLE)
         self.selected_piece = None
         self.selected_pos = None
-        self.turn = 'b'
         self.possible_moves = []
-        self.check = {'b': False, 'p': False}
-        self.king_positions = {'b': (7, 4), 'p': (0, 4)}
+        self.book_moves = []
         self.capturable_pieces = set()
-        self.game_over = False
-        self.winner = None
-        self.font = pygame.font.SysFont('Arial', 48)
-        self.load_pieces()
-        self.init_board()
-        self.promoting_pawn = None
+        self.show_stats = False
+        self.book = OpeningBook(book) if book else None
+        self.tablebase = Tablebase(tablebase) if tablebase else None
+        self.atlas = PieceAtlas()
+        self.position = Position.from_fen(fen)
+        self.save_pgn = save_pgn
         self.promotion_options = ['D', 'T', 'B', 'C']
+        self.computer = computer
+        self.think_ms = think_ms
+        self.searcher = Searcher() if computer else None
+        self.clock = pygame.time.Clock()
+        self.set_square_size(SCREEN_SIZE // BOARD_SIZE)
+        self.drawn_states = {}
+        self.drawn_overlay = None
+        self.needs_full_redraw = True
+        self.needs_render = True
+        self.announce_result()
+
+    def set_square_size(self, size):
+        """Lay the board out with squares of size pixels and rebuild everything drawn at that scale."""
+        self.square_size = max(int(size), MIN_SQUARE_SIZE)
+        self.board_pixels = self.square_size * BOARD_SIZE
+        self.font = pygame.font.SysFont('Arial', max(12, self.square_size * 16 // 25))
+        self.stats_font = pygame.font.SysFont('Courier', max(9, self.square_size // 7))
+        self.load_pieces()
+        self.build_surfaces()
+        self.needs_full_redraw = True
+        self.needs_render = True
 
     def load_pieces(self):
-        """Load images for chess pieces."""
-        def load_image(path):
-            if not os.path.isfile(path):
-                raise FileNotFoundError(f"No file '{path}' found in working directory '{os.getcwd()}'")
-            return pygame.transform.scale(pygame.image.load(path), (int(SQUARE_SIZE), int(SQUARE_SIZE)))
-
-        self.black_pieces = {
-            'Pp': load_image('projectXadrez/pecas_pretas/pawn1.png'),
-            'Tp': load_image('projectXadrez/pecas_pretas/rook1.png'),
-            'Cp': load_image('projectXadrez/pecas_pretas/knight1.png'),
-            'Bp': load_image('projectXadrez/pecas_pretas/bishop1.png'),
-            'Dp': load_image('projectXadrez/pecas_pretas/queen1.png'),
-            'Rp': load_image('projectXadrez/pecas_pretas/king1.png')
-        }
-
-        self.white_pieces = {
-            'Pb': load_image('projectXadrez/pecas_brancas/pawn.png'),
-            'Tb': load_image('projectXadrez/pecas_brancas/rook.png'),
-            'Cb': load_image('projectXadrez/pecas_brancas/knight.png'),
-            'Bb': load_image('projectXadrez/pecas_brancas/bishop.png'),
-            'Db': load_image('projectXadrez/pecas_brancas/queen.png'),
-            'Rb': load_image('projectXadrez/pecas_brancas/king.png')
-        }
-
-    def init_board(self):
-        """Initialize the chess board with starting positions."""
-        self.board = [
-            ['Tp', 'Cp', 'Bp', 'Dp', 'Rp', 'Bp', 'Cp', 'Tp'],
-            ['Pp'] * 8,
-            ['  '] * 8,
-            ['  '] * 8,
-            ['  '] * 8,
-            ['  '] * 8,
-            ['Pb'] * 8,
-            ['Tb', 'Cb', 'Bb', 'Db', 'Rb', 'Bb', 'Cb', 'Tb']
-        ]
-
-    def is_valid_move(self, start_pos, end_pos):
-        """Check if a move is valid."""
-        start_row, start_col = start_pos
-        end_row, end_col = end_pos
-        piece = self.board[start_row][start_col].strip()
-        
-        if piece[1] != self.turn:
-            return False
-
-        end_piece = self.board[end_row][end_col].strip()
-        if end_piece and end_piece[1] == piece[1]:
-            return False
-
-        piece_type = piece[0]
-        if piece_type == 'P':
-            if piece[1] == 'b':
-                if end_col == start_col and end_row == start_row - 1 and not end_piece:
-                    return True
-                if start_row == 6 and end_col == start_col and end_row == start_row - 2:
-                    return not end_piece and not self.board[start_row - 1][start_col].strip()
-                if end_row == start_row - 1 and abs(end_col - start_col) == 1 and end_piece:
-                    return True
-            else:
-                if end_col == start_col and end_row == start_row + 1 and not end_piece:
-                    return True
-                if start_row == 1 and end_col == start_col and end_row == start_row + 2:
-                    return not end_piece and not self.board[start_row + 1][start_col].strip()
-                if end_row == start_row + 1 and abs(end_col - start_col) == 1 and end_piece:
-                    return True
-            return False
-
-        return (end_row, end_col) in self.get_possible_moves((start_row, start_col))
-
-    def is_king_in_check(self, color, ignore_piece=None):
-        """Check if the king of the given color is in check."""
-        king_pos = self.king_positions[color]
-        opponent_color = 'p' if color == 'b' else 'b'
-        
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col].strip()
-                if piece and piece[1] == opponent_color:
-                    if ignore_piece and (row, col) == ignore_piece:
-                        continue
-                    moves = self.get_basic_moves((row, col))
-                    if king_pos in moves:
-                        return True
-        return False
-
-    def move_piece(self, start_pos, end_pos):
-        """Move a piece from start_pos to end_pos if the move is valid."""
-        start_row, start_col = start_pos
-        end_row, end_col = end_pos
-        piece = self.board[start_row][start_col].strip()
-        
-        if not self.is_valid_move(start_pos, end_pos):
-            return False
-            
-        old_board = [row[:] for row in self.board]
-        old_king_pos = self.king_positions.copy()
-        
-        self.board[end_row][end_col] = self.board[start_row][start_col]
-        self.board[start_row][start_col] = '  '
-        
-        if piece[0] == 'R':
-            self.king_positions[piece[1]] = (end_row, end_col)
-        
-        if self.is_king_in_check(piece[1]):
-            self.board = [row[:] for row in old_board]
-            self.king_positions = old_king_pos.copy()
-            return False
-        
-        opponent_color = 'p' if piece[1] == 'b' else 'b'
-        self.check[opponent_color] = self.is_king_in_check(opponent_color)
-        self.check['b'] = self.is_king_in_check('b')
-        self.check['p'] = self.is_king_in_check('p')
-        
-        if self.check[opponent_color] and self.is_checkmate(opponent_color):
-            self.game_over = True
-            self.winner = 'Brancas' if piece[1] == 'b' else 'Pretas'
-        
-        if piece[0] == 'P' and (end_row == 0 or end_row == 7):
-            self.promoting_pawn = (end_row, end_col)
-        else:
-            self.turn = opponent_color
-            
-        return True
-
-    def get_moves_to_escape_check(self, color):
-        """Return moves that can remove the king from check."""
-        valid_moves = []
-        king_row, king_col = self.king_positions[color]
-        
-        king_piece = self.board[king_row][king_col]
-        moves = self.get_basic_moves((king_row, king_col))
-        
-        for move in moves:
-            old_board = [row[:] for row in self.board]
-            old_king_pos = self.king_positions.copy()
-            
-            self.board[move[0]][move[1]] = king_piece
-            self.board[king_row][king_col] = '  '
-            self.king_positions[color] = move
-            
-            if not self.is_king_in_check(color):
-                valid_moves.append((king_row, king_col, move[0], move[1]))
-            
-            self.board = [row[:] for row in old_board]
-            self.king_positions = old_king_pos.copy()
-        
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col].strip()
-                if piece and piece[1] == color and piece[0] != 'R':
-                    moves = self.get_basic_moves((row, col))
-                    for move_row, move_col in moves:
-                        old_board = [row[:] for row in self.board]
-                        self.board[move_row][move_col] = piece
-                        self.board[row][col] = '  '
-                        
-                        if not self.is_king_in_check(color):
-                            valid_moves.append((row, col, move_row, move_col))
-                        
-                        self.board = [row[:] for row in old_board]
-        
-        return valid_moves
-
-    def get_basic_moves(self, pos):
-        """Return basic moves for a piece without considering check."""
-        row, col = pos
-        piece = self.board[row][col].strip()
-        moves = []
-        
-        if not piece:
-            return moves
-
-        piece_type = piece[0]
-        is_white = piece[1] == 'b'
-
-        if piece_type == 'P':
-            direction = -1 if is_white else 1
-            next_row = row + direction
-            if 0 <= next_row < BOARD_SIZE and self.board[next_row][col].strip() == '':
-                moves.append((next_row, col))
-                if ((is_white and row == 6) or (not is_white and row == 1)):
-                    double_row = row + 2 * direction
-                    if 0 <= double_row < BOARD_SIZE and self.board[double_row][col].strip() == '':
-                        moves.append((double_row, col))
-            
-            for dc in [-1, 1]:
-                next_col = col + dc
-                if 0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE:
-                    target = self.board[next_row][next_col].strip()
-                    if target and target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-
-        elif piece_type == 'T':
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    next_row, next_col = row + dr * i, col + dc * i
-                    if not (0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE):
-                        break
-                    target = self.board[next_row][next_col].strip()
-                    if target == '':
-                        moves.append((next_row, next_col))
-                    elif target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-                        break
-                    else:
-                        break
-
-        elif piece_type == 'C':
-            knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                          (1, -2), (1, 2), (2, -1), (2, 1)]
-            for dr, dc in knight_moves:
-                next_row, next_col = row + dr, col + dc
-                if 0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE:
-                    target = self.board[next_row][next_col].strip()
-                    if target == '' or target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-
-        elif piece_type == 'B':
-            directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    next_row, next_col = row + dr * i, col + dc * i
-                    if not (0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE):
-                        break
-                    target = self.board[next_row][next_col].strip()
-                    if target == '':
-                        moves.append((next_row, next_col))
-                    elif target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-                        break
-                    else:
-                        break
-
-        elif piece_type == 'D':
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0),
-                        (1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                for i in range(1, BOARD_SIZE):
-                    next_row, next_col = row + dr * i, col + dc * i
-                    if not (0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE):
-                        break
-                    target = self.board[next_row][next_col].strip()
-                    if target == '':
-                        moves.append((next_row, next_col))
-                    elif target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-                        break
-                    else:
-                        break
-
-        elif piece_type == 'R':
-            directions = [(0, 1), (0, -1), (1, 0), (-1, 0),
-                        (1, 1), (1, -1), (-1, 1), (-1, -1)]
-            for dr, dc in directions:
-                next_row, next_col = row + dr, col + dc
-                if 0 <= next_row < BOARD_SIZE and 0 <= next_col < BOARD_SIZE:
-                    target = self.board[next_row][next_col].strip()
-                    if target == '' or target[1] != piece[1]:
-                        moves.append((next_row, next_col))
-
-        return moves
-
-    def would_expose_king(self, start_pos, end_pos):
-        """Check if a move would expose the king to check."""
-        start_row, start_col = start_pos
-        end_row, end_col = end_pos
-        piece = self.board[start_row][start_col].strip()
-        color = piece[1]
-        
-        old_piece = self.board[end_row][end_col]
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = '  '
-        
-        old_king_pos = None
-        if piece[0] == 'R':
-            old_king_pos = self.king_positions[color]
-            self.king_positions[color] = (end_row, end_col)
-        
-        exposed = self.is_king_in_check(color, ignore_piece=(end_row, end_col))
-        
-        self.board[start_row][start_col] = piece
-        self.board[end_row][end_col] = old_piece
-        if old_king_pos:
-            self.king_positions[color] = old_king_pos
-        
-        return exposed
-
-    def get_possible_moves(self, pos, check_for_check=True):
-        """Return possible moves considering check if check_for_check=True."""
-        row, col = pos
-        piece = self.board[row][col].strip()
-        
-        if check_for_check and self.check[self.turn] and piece[1] == self.turn:
-            valid_moves = self.get_moves_to_escape_check(self.turn)
-            moves = []
-            for start_row, start_col, end_row, end_col in valid_moves:
-                if start_row == row and start_col == col:
-                    moves.append((end_row, end_col))
-            return moves
-        
-        moves = self.get_basic_moves(pos)
-        
-        if not check_for_check:
-            return moves
-            
-        valid_moves = []
-        for move in moves:
-            if not self.would_expose_king((row, col), move):
-                valid_moves.append(move)
-                
-        return valid_moves
-
-    def get_capturable_pieces(self, pos):
-        """Return set of positions of pieces that can be captured by the selected piece."""
-        row, col = pos
-        piece = self.board[row][col].strip()
-        capturable = set()
-        
-        if piece and piece[1] == self.turn:
-            moves = self.get_possible_moves((row, col))
-            for move_row, move_col in moves:
-                target = self.board[move_row][move_col].strip()
-                if target:
-                    capturable.add((move_row, move_col))
-        
-        return capturable
+        """Fetch the piece images for the current square size from the atlas."""
+        pieces = self.atlas.pieces(self.square_size)
+        self.white_pieces = {name: image for name, image in pieces.items() if name[1] == 'b'}
+        self.black_pieces = {name: image for name, image in pieces.items() if name[1] == 'p'}
 
     def update_capturable_pieces(self):
         """Update the set of capturable pieces."""
-        self.capturable_pieces.clear()
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col].strip()
-                if piece and piece[1] == self.turn:
-                    moves = self.get_possible_moves((row, col))
-                    for move_row, move_col in moves:
-                        target = self.board[move_row][move_col].strip()
-                        if target:
-                            self.capturable_pieces.add((move_row, move_col))
-
-    def is_checkmate(self, color):
-        """Check if the given color is in checkmate."""
-        if not self.check[color]:
-            return False
-        
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col].strip()
-                if piece and piece[1] == color:
-                    moves = self.get_possible_moves((row, col))
-                    for move in moves:
-                        old_board = [row[:] for row in self.board]
-                        old_king_pos = self.king_positions.copy()
-                        
-                        self.board[move[0]][move[1]] = piece
-                        self.board[row][col] = '  '
-                        if piece[0] == 'R':
-                            self.king_positions[color] = move
-                        
-                        if not self.is_king_in_check(color):
-                            self.board = [row[:] for row in old_board]
-                            self.king_positions = old_king_pos.copy()
-                            return False
-                        
-                        self.board = [row[:] for row in old_board]
-                        self.king_positions = old_king_pos.copy()
-        return True
-
-    def draw_move_indicators(self):
-        """Draw indicators for possible moves."""
-        for move in self.possible_moves:
-            row, col = move
-            center_x = col * SQUARE_SIZE + SQUARE_SIZE // 2
-            center_y = row * SQUARE_SIZE + SQUARE_SIZE // 2
-            radius = SQUARE_SIZE // 6
-            pygame.draw.circle(self.screen, MOVE_INDICATOR_COLOR, (center_x, center_y), radius)
-
-    def draw_board(self):
-        """Draw the chess board."""
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                color = BOARD_COLOR_1 if (row + col) % 2 == 0 else BOARD_COLOR_2
-                pygame.draw.rect(self.screen, color,
-                               (SQUARE_SIZE * col, SQUARE_SIZE * row, SQUARE_SIZE, SQUARE_SIZE))
-                
-                if self.selected_pos == (row, col):
-                    s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE))
-                    s.set_alpha(128)
-                    s.fill(HIGHLIGHT_COLOR)
-                    self.screen.blit(s, (SQUARE_SIZE * col, SQUARE_SIZE * row))
-        self.draw_move_indicators()
-
-    def draw_pieces(self):
-        """Draw the chess pieces on the board."""
-        for row in range(BOARD_SIZE):
-            for col in range(BOARD_SIZE):
-                piece = self.board[row][col].strip()
-                if piece:
-                    if piece[1] == 'p':
-                        piece_surface = self.black_pieces[piece].copy()
-                    else:
-                        piece_surface = self.white_pieces[piece].copy()
-                    
-                    if piece[0] == 'R':
-                        if (piece[1] == 'b' and self.check['b']) or (piece[1] == 'p' and self.check['p']):
-                            pygame.draw.rect(piece_surface, (255, 0, 0), 
-                                          piece_surface.get_rect(), 3)
-                    elif (row, col) in self.capturable_pieces:
-                        pygame.draw.rect(piece_surface, (0, 255, 0), 
-                                      piece_surface.get_rect(), 3)
-                    
-                    self.screen.blit(piece_surface,
-                                   (SQUARE_SIZE * col, SQUARE_SIZE * row))
+        self.capturable_pieces = self.position.get_all_capturable_pieces()
+
+    def build_surfaces(self):
+        """Pre-render the static board and the overlays drawn on top of squares."""
+        size = self.square_size
+        self.background = pygame.Surface((self.board_pixels, self.board_pixels))
+        for row, col in BOARD_POSITIONS:
+            color = BOARD_COLOR_1 if (row + col) % 2 == 0 else BOARD_COLOR_2
+            self.background.fill(color, self.square_rect((row, col)))
+
+        self.highlight_surface = pygame.Surface((size, size))
+        self.highlight_surface.set_alpha(128)
+        self.highlight_surface.fill(HIGHLIGHT_COLOR)
+
+        self.move_indicator_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        pygame.draw.circle(self.move_indicator_surface, MOVE_INDICATOR_COLOR, (size // 2, size // 2), size // 6)
+        self.book_indicator_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        pygame.draw.circle(self.book_indicator_surface, BOOK_MOVE_COLOR, (size // 2, size // 2), size // 3,
+                           max(2, size // 20))
+
+        self.check_frame_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        pygame.draw.rect(self.check_frame_surface, CHECK_COLOR, self.check_frame_surface.get_rect(), 3)
+        self.capture_frame_surface = pygame.Surface((size, size), pygame.SRCALPHA)
+        pygame.draw.rect(self.capture_frame_surface, CAPTURE_COLOR, self.capture_frame_surface.get_rect(), 3)
+
+        self.dim_surface = pygame.Surface((self.board_pixels, self.board_pixels))
+        self.dim_surface.set_alpha(128)
+        self.dim_surface.fill((0, 0, 0))
+
+    def square_rect(self, pos):
+        """Return the screen rectangle of a (row, col) square."""
+        row, col = pos
+        size = self.square_size
+        return pygame.Rect(col * size, row * size, size, size)
+
+    def square_state(self, pos):
+        """Return everything that decides how a square looks, to detect when it must be redrawn."""
+        piece = self.position.piece_at(pos)
+        frame = None
+        if piece:
+            if piece[0] == 'R':
+                frame = 'check' if self.position.check[piece[1]] else None
+            elif pos in self.capturable_pieces:
+                frame = 'capture'
+        return piece, pos == self.selected_pos, pos in self.possible_moves, pos in self.book_moves, frame
+
+    def draw_board(self, squares=BOARD_POSITIONS):
+        """Draw the background, selection highlight, move and book indicators of the given squares."""
+        for pos in squares:
+            rect = self.square_rect(pos)
+            self.screen.blit(self.background, rect, rect)
+            if self.selected_pos == pos:
+                self.screen.blit(self.highlight_surface, rect)
+            if pos in self.possible_moves:
+                self.screen.blit(self.move_indicator_surface, rect)
+            if pos in self.book_moves:
+                self.screen.blit(self.book_indicator_surface, rect)
+
+    def draw_pieces(self, squares=BOARD_POSITIONS):
+        """Draw the chess pieces, with check and capture frames, on the given squares."""
+        for pos in squares:
+            piece = self.position.piece_at(pos)
+            if not piece:
+                continue
+            rect = self.square_rect(pos)
+            pieces = self.black_pieces if piece[1] == 'p' else self.white_pieces
+            self.screen.blit(pieces[piece], rect)
+
+            if piece[0] == 'R':
+                if self.position.check[piece[1]]:
+                    self.screen.blit(self.check_frame_surface, rect)
+            elif pos in self.capturable_pieces:
+                self.screen.blit(self.capture_frame_surface, rect)
+
+    def render(self):
+        """Redraw only the squares whose look changed and push just those rectangles to the display."""
+        if not self.needs_render:
+            return
+        self.needs_render = False
+        if self.show_stats:
+            # The panel covers part of the board and its numbers change every frame
+            self.needs_full_redraw = self.needs_render = True
+
+        if self.position.promoting_pawn:
+            overlay = 'promotion'
+        elif self.position.game_over:
+            overlay = 'game_over'
+        else:
+            overlay = None
+        full = self.needs_full_redraw or overlay != self.drawn_overlay
+        if overlay and not full:
+            return
+
+        states = {pos: self.square_state(pos) for pos in BOARD_POSITIONS}
+        if full:
+            dirty = BOARD_POSITIONS
+        else:
+            dirty = [pos for pos in BOARD_POSITIONS if states[pos] != self.drawn_states.get(pos)]
+            if not dirty:
+                return
+
+        if full:
+            self.screen.fill((0, 0, 0))
+        self.draw_board(dirty)
+        self.draw_pieces(dirty)
+        if overlay == 'promotion':
+            self.draw_promotion_screen()
+        elif overlay == 'game_over':
+            self.draw_checkmate_screen()
+        if self.show_stats:
+            self.draw_stats_panel()
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update([self.square_rect(pos) for pos in dirty])
+        self.drawn_states = states
+        self.drawn_overlay = overlay
+        self.needs_full_redraw = False
 
     def draw_checkmate_screen(self):
-        """Draw the checkmate screen if the game is over."""
-        if self.game_over:
-            overlay = pygame.Surface((SCREEN_SIZE, SCREEN_SIZE))
-            overlay.set_alpha(128)
-            overlay.fill((0, 0, 0))
-            self.screen.blit(overlay, (0, 0))
-            
-            text = self.font.render(f'Checkmate! {self.winner} vencem!', True, (255, 255, 255))
-            text_rect = text.get_rect(center=(SCREEN_SIZE/2, SCREEN_SIZE/2))
-            self.screen.blit(text, text_rect)
+        """Draw the end-of-game screen (checkmate or draw) if the game is over."""
+        if self.position.game_over:
+            self.screen.blit(self.dim_surface, (0, 0))
 
-    def is_promotion_position(self, pos, piece):
-        """Check if a pawn is in promotion position."""
-        row, _ = pos
-        return (piece[0] == 'P' and 
-                ((piece[1] == 'b' and row == 0) or 
-                 (piece[1] == 'p' and row == 7)))
+            if self.position.winner:
+                message = f'Checkmate! {self.position.winner} vencem!'
+            else:
+                message = f'Empate: {self.position.end_reason}'
+            text = self.font.render(message, True, (255, 255, 255))
+            text_rect = text.get_rect(center=(self.board_pixels / 2, self.board_pixels / 2))
+            self.screen.blit(text, text_rect)
 
     def draw_promotion_screen(self):
         """Draw the promotion screen if a pawn is being promoted."""
-        if not self.promoting_pawn:
+        if not self.position.promoting_pawn:
             return
             
-        row, col = self.promoting_pawn
-        color = 'b' if self.board[row][col][1] == 'b' else 'p'
-        
-        overlay = pygame.Surface((SCREEN_SIZE, SCREEN_SIZE))
-        overlay.set_alpha(128)
-        overlay.fill((0, 0, 0))
-        self.screen.blit(overlay, (0, 0))
+        color = self.position.piece_at(self.position.promoting_pawn)[1]
+        self.screen.blit(self.dim_surface, (0, 0))
         
-        option_size = SQUARE_SIZE
-        start_x = SCREEN_SIZE // 2 - (2 * option_size)
-        start_y = SCREEN_SIZE // 2 - (option_size // 2)
+        option_size = self.square_size
+        start_x, start_y = self.promotion_origin()
         
         for i, piece_type in enumerate(self.promotion_options):
             piece_key = piece_type + color
@@ -497,88 +235,178 @@ class ChessGame:
             
             self.screen.blit(piece_img, (start_x + i * option_size, start_y))
 
-    def promote_pawn(self, choice):
-        """Promote a pawn to the chosen piece."""
-        if not self.promoting_pawn:
+    def draw_stats_panel(self):
+        """Draw the instrumentation table of the busiest functions over the top of the board."""
+        lines = instrument.report(limit=STATS_LINES).splitlines()
+        line_height = self.stats_font.get_linesize()
+        panel = pygame.Surface((self.board_pixels, line_height * len(lines) + 8), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 200))
+        for i, line in enumerate(lines):
+            panel.blit(self.stats_font.render(line, True, (255, 255, 255)), (4, 4 + i * line_height))
+        self.screen.blit(panel, (0, 0))
+
+    def promotion_origin(self):
+        """Return the top-left corner of the row of promotion choices."""
+        option_size = self.square_size
+        return (self.board_pixels // 2 - (2 * option_size),
+                self.board_pixels // 2 - (option_size // 2))
+
+    def book_targets(self, pos):
+        """Return the squares the piece on pos can reach with an opening book move."""
+        if not self.book:
+            return []
+        start = square(pos)
+        return [square_pos(move[1]) for move, _, _ in self.book.moves(self.position) if move[0] == start]
+
+    def play_computer_move(self):
+        """Let the engine choose and play a move for its color, from the book while it has one."""
+        move = self.book.choose(self.position) if self.book else None
+        if move is None:
+            move = self.searcher.search(self.position, self.think_ms).move
+        if move:
+            self.position.play_move(move)
+            self.announce_result()
+        self.selected_piece = None
+        self.selected_pos = None
+        self.possible_moves = []
+        self.book_moves = []
+        self.capturable_pieces.clear()
+
+    def announce_result(self):
+        """Show the tablebase verdict of the current position in the window title."""
+        if not self.tablebase:
             return
-            
-        row, col = self.promoting_pawn
-        color = self.board[row][col][1]
-        self.board[row][col] = choice + color
-        self.promoting_pawn = None
-        
-        self.check['b'] = self.is_king_in_check('b')
-        self.check['p'] = self.is_king_in_check('p')
-        
-        opponent_color = 'p' if color == 'b' else 'b'
-        if self.check[opponent_color] and self.is_checkmate(opponent_color):
-            self.game_over = True
-            self.winner = 'Brancas' if color == 'b' else 'Pretas'
+        result = None if self.position.game_over else self.tablebase.probe(self.position)
+        caption = SCREEN_TITLE
+        if result:
+            outcome, plies = result
+            side = 'Brancas' if self.position.turn == 'b' else 'Pretas'
+            other = 'Pretas' if self.position.turn == 'b' else 'Brancas'
+            if outcome == 'win':
+                caption += f' - {side} dão mate em {(plies + 1) // 2}'
+            elif outcome == 'loss':
+                caption += f' - {other} dão mate em {plies // 2}'
+            else:
+                caption += ' - Empate forçado'
+        pygame.display.set_caption(caption)
+
+    def is_computer_turn(self):
+        """Check if the engine should move now."""
+        return (self.computer == self.position.turn and not self.position.game_over
+                and not self.position.promoting_pawn)
+
+    def save_game(self):
+        """Append the moves played so far to the save_pgn file, if one was given."""
+        if not self.save_pgn or not self.position.history:
+            return
+        players = {color: 'Computador' if color == self.computer else 'Jogador' for color in ('b', 'p')}
+        headers = {'Event': 'Xadrez', 'Date': time.strftime('%Y.%m.%d'),
+                   'White': players['b'], 'Black': players['p']}
+        with open(self.save_pgn, 'a', encoding='utf-8') as out:
+            write_game(Game.from_position(self.position, headers), out)
 
     def run(self):
         """Run the main game loop."""
         while True:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.save_game()
+                    if instrument.is_enabled():
+                        print(instrument.report())
                     pygame.quit()
                     exit()
 
-                if event.type == pygame.MOUSEBUTTONUP:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and instrument.is_enabled():
+                    self.show_stats = not self.show_stats
+                    print(instrument.report())
+                    self.needs_full_redraw = True
+                    self.needs_render = True
+
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.needs_full_redraw = True
+                    self.needs_render = True
+
+                if event.type == pygame.VIDEORESIZE:
+                    self.screen = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
+                    self.set_square_size(min(event.w, event.h) // BOARD_SIZE)
+
+                if event.type == pygame.MOUSEBUTTONUP and not self.is_computer_turn() \
+                        and not self.position.game_over:
+                    self.needs_render = True
                     pos = pygame.mouse.get_pos()
-                    col = int(pos[0] // SQUARE_SIZE)
-                    row = int(pos[1] // SQUARE_SIZE)
+                    col = pos[0] // self.square_size
+                    row = pos[1] // self.square_size
                     
-                    if self.promoting_pawn:
-                        option_size = SQUARE_SIZE
-                        start_x = SCREEN_SIZE // 2 - (2 * option_size)
-                        start_y = SCREEN_SIZE // 2 - (option_size // 2)
+                    if self.position.promoting_pawn:
+                        option_size = self.square_size
+                        start_x, start_y = self.promotion_origin()
                         
                         if start_y <= pos[1] <= start_y + option_size:
                             if start_x <= pos[0] <= start_x + 4 * option_size:
                                 choice_idx = int((pos[0] - start_x) // option_size)
                                 if 0 <= choice_idx < len(self.promotion_options):
-                                    self.promote_pawn(self.promotion_options[choice_idx])
-                                    self.turn = 'p' if self.turn == 'b' else 'b'
+                                    self.position.promote_pawn(self.promotion_options[choice_idx])
+                                    self.announce_result()
+                        continue
+
+                    if not (0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE):
                         continue
 
                     if self.selected_piece:
                         moved = False
                         if (row, col) in self.possible_moves:
-                            moved = self.move_piece(self.selected_pos, (row, col))
+                            moved = self.position.move_piece(self.selected_pos, (row, col))
                         
                         if moved:
+                            self.announce_result()
                             self.selected_piece = None
                             self.selected_pos = None
                             self.possible_moves = []
+                            self.book_moves = []
                             self.capturable_pieces.clear()
                         else:
-                            piece = self.board[row][col].strip()
-                            if piece and piece[1] == self.turn:
+                            piece = self.position.piece_at((row, col))
+                            if piece and piece[1] == self.position.turn:
                                 self.selected_piece = piece
                                 self.selected_pos = (row, col)
-                                self.possible_moves = self.get_possible_moves((row, col))
-                                self.capturable_pieces = self.get_capturable_pieces((row, col))
+                                self.possible_moves = self.position.get_possible_moves((row, col))
+                                self.book_moves = self.book_targets((row, col))
+                                self.capturable_pieces = self.position.get_capturable_pieces((row, col))
                             else:
                                 self.selected_piece = None
                                 self.selected_pos = None
                                 self.possible_moves = []
+                                self.book_moves = []
                                 self.capturable_pieces.clear()
                     else:
-                        piece = self.board[row][col].strip()
-                        if piece and piece[1] == self.turn:
+                        piece = self.position.piece_at((row, col))
+                        if piece and piece[1] == self.position.turn:
                             self.selected_piece = piece
                             self.selected_pos = (row, col)
-                            self.possible_moves = self.get_possible_moves((row, col))
-                            self.capturable_pieces = self.get_capturable_pieces((row, col))
-
-            self.draw_board()
-            self.draw_pieces()
-            if self.promoting_pawn:
-                self.draw_promotion_screen()
-            elif self.game_over:
-                self.draw_checkmate_screen()
-            pygame.display.update()
+                            self.possible_moves = self.position.get_possible_moves((row, col))
+                            self.book_moves = self.book_targets((row, col))
+                            self.capturable_pieces = self.position.get_capturable_pieces((row, col))
+
+            self.render()
+
+            if self.is_computer_turn():
+                self.play_computer_move()
+                self.needs_render = True
+            self.clock.tick(FPS)
 
 if __name__ == '__main__':
-    game = ChessGame()
+    parser = argparse.ArgumentParser(description='Xadrez em Python.')
+    parser.add_argument('--computer', choices=['b', 'p'],
+                        help="color played by the computer ('b' for white, 'p' for black)")
+    parser.add_argument('--think-ms', type=int, default=1000, help='computer thinking time per move')
+    parser.add_argument('--fen', default=START_FEN, help='start from this FEN position')
+    parser.add_argument('--save-pgn', metavar='PATH', help='append the game to this PGN file on quit')
+    parser.add_argument('--book', metavar='PATH', help='opening book built with book.py')
+    parser.add_argument('--tablebase', metavar='DIR', help='directory of endgame tables built with tablebase.py')
+    parser.add_argument('--stats', action='store_true',
+                        help='time the rules and drawing functions; F3 shows the numbers, which are printed on quit')
+    args = parser.parse_args()
+    if args.stats:
+        instrument.enable(instrument.RULES_FUNCTIONS + [(ChessGame, instrument.RENDER_PHASES)])
+    game = ChessGame(args.computer, args.think_ms, args.fen, args.save_pgn, args.book, args.tablebase)
     game.run()
@@ -0,0 +1,89 @@
+"""Piece images packed into one atlas and scaled on demand for each square size."""
+import os
+from collections import OrderedDict
+
+import pygame
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Atlas layout: one column per piece type, white pieces on the first row and black on the second
+ATLAS_TYPES = ['P', 'T', 'C', 'B', 'D', 'R']
+ATLAS_COLORS = ['b', 'p']
+PIECE_FILES = {
+    'Pb': 'pecas_brancas/pawn.png',
+    'Tb': 'pecas_brancas/rook.png',
+    'Cb': 'pecas_brancas/knight.png',
+    'Bb': 'pecas_brancas/bishop.png',
+    'Db': 'pecas_brancas/queen.png',
+    'Rb': 'pecas_brancas/king.png',
+    'Pp': 'pecas_pretas/pawn1.png',
+    'Tp': 'pecas_pretas/rook1.png',
+    'Cp': 'pecas_pretas/knight1.png',
+    'Bp': 'pecas_pretas/bishop1.png',
+    'Dp': 'pecas_pretas/queen1.png',
+    'Rp': 'pecas_pretas/king1.png',
+}
+
+
+def asset_path(relative_path):
+    """Return the absolute path of a file shipped next to the game."""
+    return os.path.join(ASSET_DIR, relative_path)
+
+
+class PieceAtlas:
+    """Decodes the piece PNGs once on first use and keeps a few scaled copies.
+
+    Scaled atlases are cached per square size and the least recently used
+    one is dropped beyond max_sizes, so resizing the window back and forth
+    rescales from memory instead of decoding the files again.
+    """
+
+    def __init__(self, max_sizes=4):
+        self.max_sizes = max_sizes
+        self._atlas = None
+        self._cell_size = None
+        self._scaled = OrderedDict()
+
+    def atlas(self):
+        """Return the unscaled atlas surface, loading the images on first call."""
+        if self._atlas is None:
+            images = {}
+            for name, relative_path in PIECE_FILES.items():
+                path = asset_path(relative_path)
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(f"No piece image '{path}' found")
+                images[name] = pygame.image.load(path)
+
+            cell = max(max(image.get_size()) for image in images.values())
+            atlas = pygame.Surface((cell * len(ATLAS_TYPES), cell * len(ATLAS_COLORS)), pygame.SRCALPHA)
+            for name, image in images.items():
+                if image.get_size() != (cell, cell):
+                    image = pygame.transform.scale(image, (cell, cell))
+                atlas.blit(image, self._cell_rect(name, cell))
+            if pygame.display.get_surface() is not None:
+                atlas = atlas.convert_alpha()
+            self._atlas = atlas
+            self._cell_size = cell
+        return self._atlas
+
+    def pieces(self, size):
+        """Return {piece code: surface} for squares of size pixels."""
+        size = int(size)
+        if size in self._scaled:
+            self._scaled.move_to_end(size)
+            return self._scaled[size][1]
+
+        atlas = self.atlas()
+        scaled = pygame.transform.scale(atlas, (size * len(ATLAS_TYPES), size * len(ATLAS_COLORS)))
+        pieces = {name: scaled.subsurface(self._cell_rect(name, size)) for name in PIECE_FILES}
+        self._scaled[size] = (scaled, pieces)
+        while len(self._scaled) > self.max_sizes:
+            self._scaled.popitem(last=False)
+        return pieces
+
+    @staticmethod
+    def _cell_rect(name, cell):
+        """Return the atlas rectangle holding a piece for a given cell size."""
+        col = ATLAS_TYPES.index(name[0])
+        row = ATLAS_COLORS.index(name[1])
+        return pygame.Rect(col * cell, row * cell, cell, cell)
@@ -0,0 +1,228 @@
+"""Vectorized evaluation of many positions at once with NumPy.
+
+Positions are handled in two layouts:
+
+- squares: (N, 64) uint8 of the board's own piece codes, square 0 = a8,
+  square 63 = h1 (the order of the board rows and of packed records);
+- planes: (N, 12, 8, 8) uint8 one-hot planes, white pawn, knight, bishop,
+  rook, queen, king, then the same for black.
+
+evaluate_batch() reproduces engine.evaluate for every row, and
+batch_features() adds mobility and simple pawn and piece features, all
+without a Python loop over positions.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from engine import PIECE_SQUARE, PIECE_VALUES
+from rules import BISHOP, BLACK, KING, KNIGHT, PAWN, QUEEN, ROOK, SQUARES, WHITE
+
+KINDS = (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)
+# Piece code of each plane
+PLANE_CODES = np.array([kind | color for color in (WHITE, BLACK) for kind in KINDS], dtype=np.uint8)
+
+# Material plus piece-square score of each (piece code, square), white positive
+PSQT = np.array([[PIECE_SQUARE[code][sq] for sq in SQUARES] for code in range(16)], dtype=np.int32)
+SQUARE_RANGE = np.arange(64)
+MATERIAL = np.array([PIECE_VALUES[kind] for kind in KINDS], dtype=np.int32)
+
+# Row and column steps of each piece's moves, for the mobility estimate
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+BISHOP_STEPS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_STEPS = ((-1, 0), (0, -1), (0, 1), (1, 0))
+KING_STEPS = BISHOP_STEPS + ROOK_STEPS
+
+
+def encode_positions(positions):
+    """Return (squares, white_to_move) arrays for a sequence of Positions."""
+    positions = list(positions)
+    squares = np.empty((len(positions), 64), dtype=np.uint8)
+    board_squares = np.array(SQUARES)
+    for row, position in enumerate(positions):
+        squares[row] = np.frombuffer(position.board, dtype=np.uint8)[board_squares]
+    white_to_move = np.array([position.turn == 'b' for position in positions], dtype=bool)
+    return squares, white_to_move
+
+
+def decode_records(buffer, count=None):
+    """Return (squares, white_to_move) for packed position records (see packed.py), without a Python loop."""
+    from packed import POSITION_SIZE
+
+    records = np.frombuffer(buffer, dtype=np.uint8, count=-1 if count is None else count * POSITION_SIZE)
+    records = records.reshape(-1, POSITION_SIZE)
+    occupied = np.unpackbits(records[:, :8], axis=1, bitorder='little').astype(bool)
+    nibbles = np.empty((len(records), 32), dtype=np.uint8)
+    nibbles[:, 0::2] = records[:, 8:24] & 0xF
+    nibbles[:, 1::2] = records[:, 8:24] >> 4
+    # The k-th occupied square takes the k-th nibble
+    order = np.cumsum(occupied, axis=1) - 1
+    squares = np.take_along_axis(nibbles, np.clip(order, 0, 31), axis=1)
+    squares[~occupied] = 0
+    return squares, (records[:, 24] & 1) == 0
+
+
+def squares_to_planes(squares):
+    """Convert (N, 64) piece codes to (N, 12, 8, 8) one-hot planes."""
+    squares = np.asarray(squares)
+    planes = squares[:, None, :] == PLANE_CODES[None, :, None]
+    return planes.reshape(-1, 12, 8, 8).astype(np.uint8)
+
+
+def planes_to_squares(planes):
+    """Convert (N, 12, 8, 8) one-hot planes to (N, 64) piece codes."""
+    planes = np.asarray(planes).reshape(-1, 12, 64).astype(bool)
+    return (planes * PLANE_CODES[None, :, None]).sum(axis=1, dtype=np.uint8)
+
+
+def as_squares(array):
+    """Accept either layout and return (N, 64) piece codes."""
+    array = np.asarray(array)
+    if array.ndim == 4:
+        return planes_to_squares(array)
+    if array.ndim != 2 or array.shape[1] != 64:
+        raise ValueError(f'Expected (N, 64) or (N, 12, 8, 8) positions, got shape {array.shape}')
+    return array
+
+
+def evaluate_batch(positions, white_to_move=None):
+    """Return engine.evaluate for every position as an int32 array.
+
+    Scores are from white's point of view unless white_to_move is given,
+    in which case they are from the side to move's, like engine.evaluate.
+    """
+    squares = as_squares(positions)
+    scores = PSQT[squares, SQUARE_RANGE].sum(axis=1, dtype=np.int32)
+    if white_to_move is not None:
+        scores = np.where(white_to_move, scores, -scores)
+    return scores
+
+
+def bitboards(mask):
+    """Pack an (N, 64) boolean array into (N,) uint64 sets, bit i for square i."""
+    return np.packbits(mask, axis=1, bitorder='little').view('<u8')[:, 0]
+
+
+def popcount(bits):
+    """Return the number of set bits of each uint64."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).astype(np.int32)
+    return np.unpackbits(bits.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1, dtype=np.int32)
+
+
+# Columns a piece can step col_step squares sideways from without leaving the board
+SOURCE_COLUMNS = {step: np.uint64(sum(0x0101010101010101 << col for col in range(8) if 0 <= col + step < 8))
+                  for step in range(-2, 3)}
+
+
+def _shift(bits, row_step, col_step):
+    """Move every set square by (row_step, col_step), dropping what falls off the edge."""
+    shift = 8 * row_step + col_step
+    bits = bits & SOURCE_COLUMNS[col_step]
+    return bits << np.uint64(shift) if shift > 0 else bits >> np.uint64(-shift)
+
+
+def mobility(squares, color):
+    """Count the pseudo-legal knight, bishop, rook, queen and king moves of a colour bit, per position."""
+    occupied = squares != 0
+    not_own = ~bitboards(occupied & ((squares & BLACK) == color))
+    empty = ~bitboards(occupied)
+    total = np.zeros(len(squares), dtype=np.int32)
+
+    def pieces(*kinds):
+        return bitboards(np.isin(squares, [kind | color for kind in kinds]))
+
+    for movers, steps in ((pieces(KNIGHT), KNIGHT_STEPS), (pieces(KING), KING_STEPS)):
+        for row_step, col_step in steps:
+            total += popcount(_shift(movers, row_step, col_step) & not_own)
+
+    # Pieces on one line never share a ray square: the one behind is blocked by the one in front
+    for sliders, steps in ((pieces(BISHOP, QUEEN), BISHOP_STEPS), (pieces(ROOK, QUEEN), ROOK_STEPS)):
+        for row_step, col_step in steps:
+            frontier = sliders
+            for _ in range(7):
+                frontier = _shift(frontier, row_step, col_step)
+                if not frontier.any():
+                    break
+                total += popcount(frontier & not_own)
+                frontier &= empty
+    return total
+
+
+def batch_features(positions):
+    """Return a dict of per-position feature arrays for either layout.
+
+    'psqt' is engine.evaluate from white's side; the other features are
+    (N, 2) arrays with white in column 0 and black in column 1.
+    """
+    squares = as_squares(positions)
+    rows = np.arange(len(squares), dtype=np.int64)[:, None] * 16
+    # One bincount over every row at once, offset so each position gets its own 16 bins
+    counts = np.bincount((squares + rows).ravel(), minlength=16 * len(squares)).reshape(-1, 16)
+    counts = counts[:, PLANE_CODES].astype(np.int32)
+
+    features = {
+        'psqt': evaluate_batch(squares),
+        'piece_counts': counts,
+        'material': np.stack([counts[:, :6] @ MATERIAL, counts[:, 6:] @ MATERIAL], axis=1),
+        'bishop_pair': np.stack([counts[:, 2] >= 2, counts[:, 8] >= 2], axis=1),
+        'mobility': np.stack([mobility(squares, WHITE), mobility(squares, BLACK)], axis=1),
+    }
+    doubled = []
+    isolated = []
+    boards = squares.reshape(-1, 8, 8)
+    for color in (WHITE, BLACK):
+        pawn_files = (boards == PAWN | color).sum(axis=1, dtype=np.int32)
+        doubled.append(np.maximum(pawn_files - 1, 0).sum(axis=1))
+        neighbours = np.zeros_like(pawn_files)
+        neighbours[:, 1:] += pawn_files[:, :-1]
+        neighbours[:, :-1] += pawn_files[:, 1:]
+        isolated.append((pawn_files * (neighbours == 0)).sum(axis=1))
+    features['doubled_pawns'] = np.stack(doubled, axis=1)
+    features['isolated_pawns'] = np.stack(isolated, axis=1)
+    return features
+
+
+def evaluate_chunks(squares, white_to_move=None, chunk=1 << 16):
+    """Evaluate a large array in chunks to bound temporary memory."""
+    scores = np.empty(len(squares), dtype=np.int32)
+    for start in range(0, len(squares), chunk):
+        part = None if white_to_move is None else white_to_move[start:start + chunk]
+        scores[start:start + chunk] = evaluate_batch(squares[start:start + chunk], part)
+    return scores
+
+
+def main(argv=None):
+    from packed import POSITION_HEADER, PositionFile
+
+    parser = argparse.ArgumentParser(description='Vectorized evaluation of a packed position file.')
+    parser.add_argument('path', help='position file written by packed.py')
+    parser.add_argument('--features', action='store_true', help='also time the full feature set')
+    parser.add_argument('--repeat', type=int, default=1, help='evaluate the file this many times')
+    args = parser.parse_args(argv)
+
+    with PositionFile(args.path) as positions:
+        count = len(positions)
+        start = time.perf_counter()
+        squares, white_to_move = decode_records(positions.view[POSITION_HEADER.size:], count)
+        decoded = time.perf_counter()
+        for _ in range(args.repeat):
+            scores = evaluate_chunks(squares, white_to_move)
+        evaluated = time.perf_counter()
+
+    rate = count * args.repeat / max(evaluated - decoded, 1e-9)
+    print(f'{count} positions decoded in {decoded - start:.3f}s, evaluated at {rate:,.0f} positions/s')
+    print(f'mean score {scores.mean():.1f}, min {scores.min()}, max {scores.max()}')
+    if args.features:
+        start = time.perf_counter()
+        features = batch_features(squares)
+        elapsed = time.perf_counter() - start
+        print(f'features in {elapsed:.3f}s ({count / max(elapsed, 1e-9):,.0f} positions/s): '
+              + ', '.join(features))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""Bitboard move generation behind the same API as rules.Position.
+
+BitboardPosition keeps one 64-bit set per piece code and one per colour
+next to the mailbox, updating them in make_move/unmake_move. Knight, king
+and pawn attacks come from tables; sliding attacks are looked up per line
+(rank, file, diagonal, anti-diagonal) in a dict keyed by the occupancy of
+that line, which does the job of a magic multiply since Python ints hash
+directly. Moves are still (start, end, promotion) mailbox tuples, so the
+engine, PGN code and UI work unchanged on either backend.
+
+Bit i is square row * 8 + col with row 0 being rank 8, so a8 is bit 0
+and h1 is bit 63.
+"""
+from rules import (
+    BISHOP, BLACK, CASTLING_MOVES, COLOR_MASK, COLORS, EMPTY, KING, KNIGHT, PAWN,
+    PROMOTION_PIECES, QUEEN, ROOK, SQUARES, TYPE_MASK, WHITE, Position,
+)
+
+SQUARE_INDEX = [-1] * 120
+for _index, _sq in enumerate(SQUARES):
+    SQUARE_INDEX[_sq] = _index
+
+
+def _leaper_attacks(offsets):
+    """Return the attack set of a one-step piece with mailbox offsets, per square."""
+    table = []
+    for sq in SQUARES:
+        attacks = 0
+        for offset in offsets:
+            if SQUARE_INDEX[sq + offset] >= 0:
+                attacks |= 1 << SQUARE_INDEX[sq + offset]
+        table.append(attacks)
+    return table
+
+
+def _ray(sq, offset):
+    """Return the mailbox squares from sq (exclusive) to the edge along offset."""
+    squares = []
+    sq += offset
+    while SQUARE_INDEX[sq] >= 0:
+        squares.append(sq)
+        sq += offset
+    return squares
+
+
+def _line_table(offset):
+    """Return (mask, {masked occupancy: attacks}) per square for the line through it along offset."""
+    table = []
+    for sq in SQUARES:
+        rays = (_ray(sq, offset), _ray(sq, -offset))
+        line = [SQUARE_INDEX[to] for ray in rays for to in ray]
+        mask = sum(1 << index for index in line)
+        attacks = {}
+        for subset in range(1 << len(line)):
+            occupancy = sum(1 << index for bit, index in enumerate(line) if subset >> bit & 1)
+            reach = 0
+            for ray in rays:
+                for to in ray:
+                    reach |= 1 << SQUARE_INDEX[to]
+                    if occupancy >> SQUARE_INDEX[to] & 1:
+                        break
+            attacks[occupancy] = reach
+        table.append((mask, attacks))
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks((-21, -19, -12, -8, 8, 12, 19, 21))
+KING_ATTACKS = _leaper_attacks((-11, -10, -9, -1, 1, 9, 10, 11))
+# Squares attacked by a pawn of each colour standing on a square
+PAWN_ATTACKS = {WHITE: _leaper_attacks((-11, -9)), BLACK: _leaper_attacks((9, 11))}
+
+RANK_LINES = _line_table(1)
+FILE_LINES = _line_table(10)
+DIAGONAL_LINES = _line_table(9)
+ANTI_DIAGONAL_LINES = _line_table(11)
+
+
+def rook_attacks(index, occupancy):
+    """Return the squares a rook on index attacks through occupancy."""
+    mask, table = RANK_LINES[index]
+    attacks = table[occupancy & mask]
+    mask, table = FILE_LINES[index]
+    return attacks | table[occupancy & mask]
+
+
+def bishop_attacks(index, occupancy):
+    """Return the squares a bishop on index attacks through occupancy."""
+    mask, table = DIAGONAL_LINES[index]
+    attacks = table[occupancy & mask]
+    mask, table = ANTI_DIAGONAL_LINES[index]
+    return attacks | table[occupancy & mask]
+
+
+def _between_table():
+    """Return the squares strictly between two aligned squares, 0 when not aligned."""
+    between = [[0] * 64 for _ in range(64)]
+    for sq in SQUARES:
+        for offset in (-11, -10, -9, -1, 1, 9, 10, 11):
+            squares = 0
+            for to in _ray(sq, offset):
+                between[SQUARE_INDEX[sq]][SQUARE_INDEX[to]] = squares
+                squares |= 1 << SQUARE_INDEX[to]
+    return between
+
+
+BETWEEN = _between_table()
+FULL = (1 << 64) - 1
+ROW_MASKS = [0xFF << (8 * row) for row in range(8)]
+FILE_MASKS = [0x0101010101010101 << col for col in range(8)]
+# Pawns of either colour promote on the first or last row
+PROMOTION_ROWS = ROW_MASKS[0] | ROW_MASKS[7]
+
+
+def bit_squares(bits):
+    """Yield the square indexes set in bits, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitboardPosition(Position):
+    """A Position that also keeps piece bitboards and generates moves from them."""
+
+    def init_board(self):
+        super().init_board()
+        self.sync_bitboards()
+
+    def reset_game_state(self, update_state=True):
+        self.sync_bitboards()
+        super().reset_game_state(update_state)
+
+    def sync_bitboards(self):
+        """Rebuild every bitboard from the mailbox."""
+        self.pieces = [0] * 16
+        self.colors = [0] * (BLACK + 1)
+        for index, sq in enumerate(SQUARES):
+            piece = self.board[sq]
+            if piece != EMPTY:
+                self.pieces[piece] |= 1 << index
+                self.colors[piece & COLOR_MASK] |= 1 << index
+
+    def copy(self):
+        other = super().copy()
+        other.pieces = self.pieces[:]
+        other.colors = self.colors[:]
+        return other
+
+    def make_move(self, move):
+        super().make_move(move)
+        self._toggle(self.history[-1])
+
+    def unmake_move(self):
+        self._toggle(self.history[-1])
+        return super().unmake_move()
+
+    def _toggle(self, record):
+        """Flip the bits a move changes; applying it twice restores the bitboards."""
+        (start, end, promotion), piece, captured, _, ep_square, _, _ = record
+        pieces = self.pieces
+        colors = self.colors
+        color = piece & COLOR_MASK
+        from_bit = 1 << SQUARE_INDEX[start]
+        to_bit = 1 << SQUARE_INDEX[end]
+        pieces[piece] ^= from_bit
+        pieces[promotion | color if promotion else piece] ^= to_bit
+        colors[color] ^= from_bit | to_bit
+        if captured:
+            pieces[captured] ^= to_bit
+            colors[captured & COLOR_MASK] ^= to_bit
+            return
+
+        kind = piece & TYPE_MASK
+        if kind == PAWN and end == ep_square:
+            taken = 1 << SQUARE_INDEX[end + 10 if color == WHITE else end - 10]
+            pieces[PAWN | color ^ COLOR_MASK] ^= taken
+            colors[color ^ COLOR_MASK] ^= taken
+        elif kind == KING and abs(end - start) == 2:
+            rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+            rook_bits = 1 << SQUARE_INDEX[rook_start] | 1 << SQUARE_INDEX[rook_end]
+            pieces[ROOK | color] ^= rook_bits
+            colors[color] ^= rook_bits
+
+    def attackers(self, index, by, occupancy):
+        """Return the pieces of colour bit by attacking square index through occupancy."""
+        pieces = self.pieces
+        return ((PAWN_ATTACKS[by ^ COLOR_MASK][index] & pieces[PAWN | by])
+                | (KNIGHT_ATTACKS[index] & pieces[KNIGHT | by])
+                | (KING_ATTACKS[index] & pieces[KING | by])
+                | (bishop_attacks(index, occupancy) & (pieces[BISHOP | by] | pieces[QUEEN | by]))
+                | (rook_attacks(index, occupancy) & (pieces[ROOK | by] | pieces[QUEEN | by])))
+
+    def _is_attacked(self, sq, by):
+        """Test mailbox square sq for attackers of colour bit by."""
+        return self.attackers(SQUARE_INDEX[sq], by, self.colors[WHITE] | self.colors[BLACK]) != 0
+
+    def generate_moves(self, color=None):
+        """Return every legal (start, end, promotion) move for color, the side to move by default."""
+        color = self.turn if color is None else color
+        own = COLORS[color]
+        enemy = own ^ COLOR_MASK
+        pieces = self.pieces
+        own_bits = self.colors[own]
+        enemy_bits = self.colors[enemy]
+        occupancy = own_bits | enemy_bits
+        king = pieces[KING | own].bit_length() - 1
+        king_sq = SQUARES[king]
+
+        checkers = self.attackers(king, enemy, occupancy)
+
+        moves = []
+        without_king = occupancy ^ 1 << king
+        for to in bit_squares(KING_ATTACKS[king] & ~own_bits):
+            if not self.attackers(to, enemy, without_king):
+                moves.append((king_sq, SQUARES[to], EMPTY))
+        if checkers & (checkers - 1):
+            return moves
+
+        board = self.board
+        if not checkers and self.castling and color == self.turn:
+            for right, king_start, king_end, rook_start, empty, safe in CASTLING_MOVES[own]:
+                if (self.castling & right and king_sq == king_start
+                        and board[rook_start] == ROOK | own
+                        and all(board[sq] == EMPTY for sq in empty)
+                        and not any(self.attackers(SQUARE_INDEX[sq], enemy, occupancy) for sq in safe)):
+                    moves.append((king_sq, king_end, EMPTY))
+
+        # Squares a non-king move may land on: anywhere, or onto the check line
+        target = ~own_bits & FULL
+        if checkers:
+            target &= checkers | BETWEEN[king][checkers.bit_length() - 1]
+
+        # An enemy slider lined up with the king through exactly one own piece pins it
+        pins = {}
+        snipers = ((rook_attacks(king, enemy_bits) & (pieces[ROOK | enemy] | pieces[QUEEN | enemy]))
+                   | (bishop_attacks(king, enemy_bits) & (pieces[BISHOP | enemy] | pieces[QUEEN | enemy])))
+        for sniper in bit_squares(snipers):
+            blockers = BETWEEN[king][sniper] & occupancy
+            if blockers and not blockers & (blockers - 1) and blockers & own_bits:
+                pins[blockers.bit_length() - 1] = BETWEEN[king][sniper] | 1 << sniper
+
+        ep_square = self.ep_square
+        if ep_square and color == self.turn:
+            # Rare enough to test by playing it; this also covers the pawn pair leaving a rank pin
+            for sq in bit_squares(PAWN_ATTACKS[enemy][SQUARE_INDEX[ep_square]] & pieces[PAWN | own]):
+                move = (SQUARES[sq], ep_square, EMPTY)
+                self.make_move(move)
+                if not self._is_attacked(king_sq, enemy):
+                    moves.append(move)
+                self.unmake_move()
+
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            movers = pieces[kind | own]
+            while movers:
+                low = movers & -movers
+                movers ^= low
+                start = low.bit_length() - 1
+                if kind == KNIGHT:
+                    reach = KNIGHT_ATTACKS[start]
+                elif kind == BISHOP:
+                    reach = bishop_attacks(start, occupancy)
+                elif kind == ROOK:
+                    reach = rook_attacks(start, occupancy)
+                else:
+                    reach = rook_attacks(start, occupancy) | bishop_attacks(start, occupancy)
+                reach &= target
+                if pins:
+                    reach &= pins.get(start, -1)
+                start_sq = SQUARES[start]
+                while reach:
+                    low = reach & -reach
+                    reach ^= low
+                    moves.append((start_sq, SQUARES[low.bit_length() - 1], EMPTY))
+
+        # Unpinned pawns move as whole sets: shift them and read each start back from its target
+        pawns = pieces[PAWN | own]
+        pinned_pawns = pawns & sum(1 << index for index in pins)
+        pawns ^= pinned_pawns
+        empty = ~occupancy & FULL
+        if own == WHITE:
+            single = pawns >> 8 & empty
+            double = (single & ROW_MASKS[5]) >> 8 & empty
+            left = (pawns & ~FILE_MASKS[0]) >> 9 & enemy_bits
+            right = (pawns & ~FILE_MASKS[7]) >> 7 & enemy_bits
+            step = -8
+        else:
+            single = pawns << 8 & empty
+            double = (single & ROW_MASKS[2]) << 8 & empty
+            left = (pawns & ~FILE_MASKS[0]) << 7 & enemy_bits
+            right = (pawns & ~FILE_MASKS[7]) << 9 & FULL & enemy_bits
+            step = 8
+        for reach, back in ((single, step), (double, 2 * step), (left, step - 1), (right, step + 1)):
+            reach &= target
+            while reach:
+                low = reach & -reach
+                reach ^= low
+                to = low.bit_length() - 1
+                start_sq, to_sq = SQUARES[to - back], SQUARES[to]
+                if low & PROMOTION_ROWS:
+                    for promotion in PROMOTION_PIECES:
+                        moves.append((start_sq, to_sq, promotion))
+                else:
+                    moves.append((start_sq, to_sq, EMPTY))
+
+        for start in bit_squares(pinned_pawns):
+            reach = PAWN_ATTACKS[own][start] & enemy_bits
+            push = start + step
+            if empty >> push & 1:
+                reach |= 1 << push
+                if start >> 3 == (6 if own == WHITE else 1) and empty >> (push + step) & 1:
+                    reach |= 1 << (push + step)
+            reach &= target & pins[start]
+            start_sq = SQUARES[start]
+            for to in bit_squares(reach):
+                if 1 << to & PROMOTION_ROWS:
+                    for promotion in PROMOTION_PIECES:
+                        moves.append((start_sq, SQUARES[to], promotion))
+                else:
+                    moves.append((start_sq, SQUARES[to], EMPTY))
+        return moves
+
+
+BACKENDS = {'mailbox': Position, 'bitboard': BitboardPosition}
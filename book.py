@@ -0,0 +1,160 @@
+"""Opening book: moves seen in a game collection, keyed by Zobrist hash.
+
+The book file is a header followed by 16-byte entries (hash, move, weight,
+games) sorted by hash, so a lookup is a binary search straight over the
+memory-mapped file and nothing is loaded up front. A move's weight counts
+2 points per win and 1 per draw for the side that played it, the same
+scheme Polyglot books use.
+"""
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+from engine import decode_move, encode_move
+from rules import START_FEN, Position
+
+BOOK_MAGIC = b'XBOK'
+BOOK_VERSION = 1
+BOOK_HEADER = struct.Struct('<4sHHQ')
+BOOK_ENTRY = struct.Struct('<QIHH')
+MAX_COUNT = 0xFFFF
+
+# Points for the side that played the move, by game result
+RESULT_POINTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+
+
+def build_book(games, path, max_ply=20, min_games=1):
+    """Write a book of the first max_ply moves of games (pgn.Game objects); return the entry count."""
+    stats = {}
+    for game in games:
+        if game.error or game.result not in RESULT_POINTS:
+            continue
+        points = RESULT_POINTS[game.result]
+        position = game.start_position()
+        for move in game.moves[:max_ply]:
+            key = (position.hash, encode_move(move))
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = [0, 0]
+            entry[0] += 1
+            entry[1] += points[0 if position.turn == 'b' else 1]
+            position.make_move(move)
+
+    entries = sorted((key, move, points, count) for (key, move), (count, points) in stats.items()
+                     if count >= min_games)
+    with open(path, 'wb') as out:
+        out.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, BOOK_ENTRY.size, len(entries)))
+        for key, move, points, count in entries:
+            # Keep the move playable even when it never scored
+            out.write(BOOK_ENTRY.pack(key, move, max(1, min(points, MAX_COUNT)), min(count, MAX_COUNT)))
+    return len(entries)
+
+
+class OpeningBook:
+    """Read-only, memory-mapped opening book with binary-search lookup."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, entry_size, self.count = BOOK_HEADER.unpack_from(self.map)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION or entry_size != BOOK_ENTRY.size:
+            self.close()
+            raise ValueError(f"'{path}' is not an opening book of version {BOOK_VERSION}")
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, index):
+        """Return (key, move code, weight, games) of entry index."""
+        return BOOK_ENTRY.unpack_from(self.map, BOOK_HEADER.size + index * BOOK_ENTRY.size)
+
+    def _first_index(self, key):
+        """Return the index of the first entry whose hash is not below key."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moves(self, position):
+        """Return [(move, weight, games)] known for position, heaviest first.
+
+        Moves that are not legal here are dropped, which also filters out
+        the rare position sharing a hash with another.
+        """
+        legal = position.legal_moves()
+        found = []
+        index = self._first_index(position.hash)
+        while index < self.count:
+            key, code, weight, games = self.entry(index)
+            if key != position.hash:
+                break
+            move = decode_move(code)
+            if move in legal:
+                found.append((move, weight, games))
+            index += 1
+        found.sort(key=lambda item: -item[1])
+        return found
+
+    def choose(self, position, rng=random):
+        """Pick a book move for position at random in proportion to its weight, or None."""
+        found = self.moves(position)
+        if not found:
+            return None
+        return rng.choices([move for move, _, _ in found], [weight for _, weight, _ in found])[0]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query opening books.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from a PGN file')
+    build.add_argument('input', help='PGN file (.gz/.bz2 allowed)')
+    build.add_argument('output', help='book file to write')
+    build.add_argument('--max-ply', type=int, default=20, help='book depth in plies')
+    build.add_argument('--min-games', type=int, default=2, help='drop moves played in fewer games')
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN, help='position to look up')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        from pgn import open_pgn, read_games
+
+        start = time.perf_counter()
+        with open_pgn(args.input) as stream:
+            count = build_book(read_games(stream), args.output, args.max_ply, args.min_games)
+        print(f'{count} entries written in {time.perf_counter() - start:.2f}s')
+        return 0
+
+    from pgn import move_to_san
+
+    position = Position.from_fen(args.fen)
+    with OpeningBook(args.book) as book:
+        start = time.perf_counter()
+        found = book.moves(position)
+        elapsed = time.perf_counter() - start
+    total = sum(weight for _, weight, _ in found) or 1
+    for move, weight, games in found:
+        print(f'{move_to_san(position, move):<8} weight {weight:>6} ({100 * weight / total:5.1f}%)  games {games}')
+    print(f'{len(found)} book move(s), lookup took {elapsed * 1e6:.0f} µs')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""Alpha-beta search engine built on the headless rules."""
+import struct
+import time
+from collections import namedtuple
+
+from rules import (
+    BISHOP, BLACK, COLOR_MASK, COLORS, EMPTY, KING, KNIGHT, PAWN, QUEEN, ROOK,
+    SQUARES, TYPE_MASK, WHITE, square_pos,
+)
+
+MATE = 30000
+INFINITY = 32000
+MAX_PLY = 64
+# The clock is read once every TIME_CHECK_MASK + 1 nodes, a few milliseconds apart
+TIME_CHECK_MASK = 127
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0, 0]
+
+# Piece-square tables from white's point of view, rank 8 first (same order as the board rows)
+PIECE_SQUARE_TABLES = {
+    PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+# Material plus square bonus for every piece code and mailbox square, signed for white
+PIECE_SQUARE = [[0] * 120 for _ in range(16)]
+for _kind, _table in PIECE_SQUARE_TABLES.items():
+    for _sq in SQUARES:
+        _row, _col = square_pos(_sq)
+        PIECE_SQUARE[_kind | WHITE][_sq] = PIECE_VALUES[_kind] + _table[_row * 8 + _col]
+        PIECE_SQUARE[_kind | BLACK][_sq] = -(PIECE_VALUES[_kind] + _table[(7 - _row) * 8 + _col])
+
+SearchResult = namedtuple('SearchResult', 'move score depth nodes seconds')
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+
+def evaluate(position):
+    """Return a static score in centipawns from the side to move's point of view."""
+    board = position.board
+    score = 0
+    for sq in SQUARES:
+        piece = board[sq]
+        if piece:
+            score += PIECE_SQUARE[piece][sq]
+    return score if position.turn == 'b' else -score
+
+
+def encode_move(move):
+    """Pack a (start, end, promotion) move into 17 bits; 0 means no move."""
+    if move is None:
+        return 0
+    start, end, promotion = move
+    return start | end << 7 | promotion << 14
+
+
+def decode_move(code):
+    """Unpack a move packed by encode_move."""
+    if not code:
+        return None
+    return code & 0x7F, code >> 7 & 0x7F, code >> 14 & 0x7
+
+
+class TranspositionTable:
+    """Fixed-size table of search results kept in a flat byte buffer.
+
+    Each bucket holds two 16-byte entries: a depth-preferred slot that is only
+    overwritten by deeper or newer results, and an always-replace slot. Entries
+    are stored as (key ^ data, data) so a torn write is seen as a miss.
+    """
+    ENTRY = struct.Struct('<QQ')
+    BUCKET_SIZE = 2 * ENTRY.size
+
+    def __init__(self, size_mb=16, buffer=None):
+        """Create a table of size_mb megabytes, or over an existing writable buffer."""
+        if buffer is None:
+            buffer = bytearray(int(size_mb * 1024 * 1024))
+        self.buffer = buffer
+        self.buckets = len(buffer) // self.BUCKET_SIZE
+        if not self.buckets:
+            raise ValueError('Transposition table needs room for at least one bucket')
+        self.age = 0
+
+    def new_search(self):
+        """Mark entries from earlier searches as replaceable."""
+        self.age = (self.age + 1) & 0x3F
+
+    def clear(self):
+        """Drop every entry."""
+        self.buffer[:self.buckets * self.BUCKET_SIZE] = bytes(self.buckets * self.BUCKET_SIZE)
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) stored for key, or None."""
+        offset = key % self.buckets * self.BUCKET_SIZE
+        for slot in (offset, offset + self.ENTRY.size):
+            check, data = self.ENTRY.unpack_from(self.buffer, slot)
+            if data and check ^ data == key:
+                return data >> 33 & 0xFF, data >> 41 & 0x3, (data >> 17 & 0xFFFF) - 0x8000, \
+                    decode_move(data & 0x1FFFF)
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        """Record a search result for key."""
+        offset = key % self.buckets * self.BUCKET_SIZE
+        check, data = self.ENTRY.unpack_from(self.buffer, offset)
+        same_key = data and check ^ data == key
+        if not (same_key or data >> 43 != self.age or depth >= data >> 33 & 0xFF):
+            offset += self.ENTRY.size
+            check, data = self.ENTRY.unpack_from(self.buffer, offset)
+            same_key = data and check ^ data == key
+
+        code = encode_move(move)
+        if not code and same_key:
+            code = data & 0x1FFFF
+        data = code | (score + 0x8000) << 17 | min(depth, 0xFF) << 33 | flag << 41 | self.age << 43
+        self.ENTRY.pack_into(self.buffer, offset, key ^ data, data)
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+
+class Searcher:
+    def __init__(self, hash_mb=16, tt=None):
+        """Create a searcher with its own transposition table unless one is given."""
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+        self.history = [0] * (16 * 120)
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.nodes = 0
+        self.deadline = None
+        self.root_move = None
+        self.should_stop = None
+
+    def search(self, position, time_ms=1000, max_depth=None, info=None, first_depth=1, new_search=True):
+        """Search position by iterative deepening and return a SearchResult.
+
+        The search stops when time_ms runs out or should_stop() returns true
+        (the current iteration is discarded; if that is the first one, its best
+        root move so far is returned), when max_depth is reached or when a
+        forced mate is found. info, if given, is called with the SearchResult
+        of each finished depth. Parallel helpers start at a later first_depth
+        and pass new_search=False to keep the shared table's age.
+        """
+        position = position.copy()
+        start = time.perf_counter()
+        self.deadline = start + time_ms / 1000 if time_ms is not None else float('inf')
+        self.nodes = 0
+        self.root_move = None
+        if new_search:
+            self.tt.new_search()
+        self.history = [0] * (16 * 120)
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+
+        moves = position.generate_moves()
+        if not moves:
+            return SearchResult(None, 0, 0, 0, 0.0)
+        result = SearchResult(moves[0], 0, 0, 0, 0.0)
+
+        for depth in range(first_depth, min(max_depth or MAX_PLY, MAX_PLY) + 1):
+            try:
+                score = self.negamax(position, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                if not result.depth and self.root_move:
+                    # Not even the first iteration finished: its best move so far beats an unsearched one
+                    result = SearchResult(self.root_move, 0, 0, self.nodes, time.perf_counter() - start)
+                break
+            elapsed = time.perf_counter() - start
+            result = SearchResult(self.root_move, score, depth, self.nodes, elapsed)
+            if info:
+                info(result)
+            if abs(score) >= MATE - MAX_PLY or len(moves) == 1:
+                break
+            # The next iteration takes several times longer; do not start one that cannot finish
+            if time_ms is not None and elapsed * 2000 > time_ms:
+                break
+        return result
+
+    def out_of_time(self):
+        """Check if the running search must be abandoned."""
+        return time.perf_counter() > self.deadline or bool(self.should_stop and self.should_stop())
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        """Return the score of position searched depth plies deep within (alpha, beta)."""
+        self.nodes += 1
+        if self.deadline and not self.nodes & TIME_CHECK_MASK and self.out_of_time():
+            raise SearchTimeout
+
+        if ply and (position.halfmove_clock >= 100 or position.repetitions[position.hash] > 1):
+            return 0
+
+        color = COLORS[position.turn]
+        in_check = position._is_attacked(position.king_positions[position.turn], color ^ COLOR_MASK)
+        if in_check and ply < MAX_PLY:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiesce(position, alpha, beta, ply)
+
+        key = position.hash
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry:
+            stored_depth, flag, score, tt_move = entry
+            if ply and stored_depth >= depth:
+                score = score_from_tt(score, ply)
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score
+
+        moves = position.generate_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        alpha_start = alpha
+        best_score = -INFINITY
+        best_move = None
+        board = position.board
+        for index, move in enumerate(self.order_moves(position, moves, tt_move, ply)):
+            position.make_move(move)
+            if index == 0:
+                score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(position, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if not ply:
+                    self.root_move = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    if not position._captured_square(move) and not move[2]:
+                        killers = self.killers[ply]
+                        if killers[0] != move:
+                            killers[1] = killers[0]
+                            killers[0] = move
+                        self.history[board[move[0]] * 120 + move[1]] += depth * depth
+                    break
+
+        if best_score <= alpha_start:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, flag, score_to_tt(best_score, ply), best_move)
+        return best_score
+
+    def quiesce(self, position, alpha, beta, ply):
+        """Search captures and queen promotions until the position is quiet."""
+        self.nodes += 1
+        if self.deadline and not self.nodes & TIME_CHECK_MASK and self.out_of_time():
+            raise SearchTimeout
+
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        board = position.board
+        captures = []
+        for move in position.generate_moves():
+            target = position._captured_square(move)
+            if (target and move[2] in (EMPTY, QUEEN)) or move[2] == QUEEN:
+                victim = board[target] & TYPE_MASK if target else EMPTY
+                gain = PIECE_VALUES[victim] + (PIECE_VALUES[QUEEN] if move[2] else 0)
+                captures.append((gain * 10 - (board[move[0]] & TYPE_MASK), move))
+        captures.sort(reverse=True)
+
+        for _, move in captures:
+            position.make_move(move)
+            score = -self.quiesce(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def order_moves(self, position, moves, tt_move, ply):
+        """Return moves sorted: hash move, captures by MVV-LVA, promotions, killers, history."""
+        board = position.board
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            if move == tt_move:
+                key = 1 << 30
+            else:
+                target = position._captured_square(move)
+                if target:
+                    key = (1 << 24) + PIECE_VALUES[board[target] & TYPE_MASK] * 10 - (board[move[0]] & TYPE_MASK)
+                elif move[2]:
+                    key = (1 << 23) + PIECE_VALUES[move[2]]
+                elif move == killers[0] or move == killers[1]:
+                    key = 1 << 22
+                else:
+                    key = history[board[move[0]] * 120 + move[1]]
+            scored.append((key, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+
+def score_to_tt(score, ply):
+    """Make mate scores relative to the stored node instead of the root."""
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """Undo score_to_tt for a node ply plies below the root."""
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+def best_move(position, time_ms=1000, max_depth=None, hash_mb=16):
+    """Return the best (start, end, promotion) move found within time_ms, or None if there is none."""
+    return Searcher(hash_mb).search(position, time_ms, max_depth).move
@@ -0,0 +1,225 @@
+"""Opt-in instrumentation of the rules engine and the renderer.
+
+Nothing here runs until enable() is called: it replaces the listed
+functions with recording wrappers, and disable() puts the originals back,
+so a game that never enables it pays nothing. For every wrapped function
+it records the call count, the time including and excluding the other
+wrapped functions it called (recursion is counted once), optionally the
+net memory it allocated (through tracemalloc), and the time per call
+stack, which write_folded() saves in the folded format flame graph tools
+read.
+"""
+import argparse
+import cProfile
+import functools
+import random
+import sys
+import time
+import tracemalloc
+
+import rules
+from rules import BOARD_SIZE, START_FEN, Position
+
+# (owner, attribute names) of the rules functions wrapped by default
+RULES_FUNCTIONS = [
+    (Position, ('make_move', 'unmake_move', 'generate_moves', 'legal_moves', 'is_valid_move', 'move_piece',
+                'play_move', 'promote_pawn', 'update_game_state', 'draw_reason', 'has_insufficient_material',
+                'is_king_in_check', 'is_square_attacked', '_is_attacked', 'is_checkmate',
+                'get_moves_to_escape_check', 'get_basic_moves', '_basic_moves', 'would_expose_king',
+                'get_possible_moves', 'get_capturable_pieces', 'get_all_capturable_pieces', 'move_info',
+                '_move_targets', '_capture_targets')),
+    (rules, ('generate_legal_moves',)),
+]
+# ChessGame methods timed as render phases
+RENDER_PHASES = ('render', 'draw_board', 'draw_pieces', 'draw_promotion_screen', 'draw_checkmate_screen')
+
+
+class Stat:
+    """Counters of one instrumented function."""
+
+    __slots__ = ('calls', 'total', 'own', 'allocated')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.allocated = 0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'total': self.total, 'own': self.own, 'allocated': self.allocated}
+
+
+_stats = {}
+_folded = {}
+# One [label, stack path, time spent in wrapped callees] per active wrapped call
+_stack = []
+_patched = []
+_tracking_allocations = False
+_started_tracemalloc = False
+
+
+def _record(label, function):
+    """Return a wrapper of function that records its calls under label."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        path = _stack[-1][1] + ';' + label if _stack else label
+        frame = [label, path, 0.0]
+        _stack.append(frame)
+        memory = tracemalloc.get_traced_memory()[0] if _tracking_allocations else 0
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _stack.pop()
+            stat = _stats.get(label)
+            if stat is None:
+                stat = _stats[label] = Stat()
+            stat.calls += 1
+            own = elapsed - frame[2]
+            stat.own += own
+            _folded[path] = _folded.get(path, 0.0) + own
+            if not any(active[0] == label for active in _stack):
+                stat.total += elapsed
+            if _stack:
+                _stack[-1][2] += elapsed
+            if _tracking_allocations:
+                stat.allocated += max(0, tracemalloc.get_traced_memory()[0] - memory)
+
+    wrapper.__instrumented__ = function
+    return wrapper
+
+
+def enable(groups=None, allocations=False):
+    """Start recording the (owner, names) groups, RULES_FUNCTIONS by default.
+
+    With allocations, tracemalloc is started as well; it slows everything
+    down several times, so the timings of such a run are only relative.
+    """
+    global _tracking_allocations, _started_tracemalloc
+    for owner, names in RULES_FUNCTIONS if groups is None else groups:
+        prefix = owner.__name__
+        for name in names:
+            original = owner.__dict__.get(name)
+            if original is None or hasattr(original, '__instrumented__'):
+                continue
+            setattr(owner, name, _record(f'{prefix}.{name}', original))
+            _patched.append((owner, name, original))
+    if allocations and not _tracking_allocations:
+        _tracking_allocations = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracemalloc = True
+
+
+def disable():
+    """Put every original function back; the recorded numbers are kept."""
+    global _tracking_allocations, _started_tracemalloc
+    while _patched:
+        owner, name, original = _patched.pop()
+        setattr(owner, name, original)
+    _tracking_allocations = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def is_enabled():
+    return bool(_patched)
+
+
+def reset():
+    """Forget everything recorded so far."""
+    _stats.clear()
+    _folded.clear()
+
+
+def stats():
+    """Return {label: {'calls', 'total', 'own', 'allocated'}}, times in seconds and memory in bytes."""
+    return {label: stat.as_dict() for label, stat in _stats.items()}
+
+
+def report(sort='own', limit=None):
+    """Return the recorded numbers as a text table, largest sort column first."""
+    rows = sorted(_stats.items(), key=lambda item: getattr(item[1], sort), reverse=True)[:limit]
+    lines = [f'{"function":<42}{"calls":>10}{"total ms":>11}{"own ms":>10}{"µs/call":>9}{"alloc KiB":>11}']
+    for label, stat in rows:
+        lines.append(f'{label:<42}{stat.calls:>10}{stat.total * 1e3:>11.1f}{stat.own * 1e3:>10.1f}'
+                     f'{stat.total * 1e6 / stat.calls:>9.1f}{stat.allocated / 1024:>11.1f}')
+    return '\n'.join(lines)
+
+
+def write_folded(out):
+    """Write 'caller;callee own-microseconds' lines, for flamegraph.pl or speedscope."""
+    for path, seconds in sorted(_folded.items()):
+        micros = round(seconds * 1e6)
+        if micros:
+            out.write(f'{path} {micros}\n')
+
+
+def play_scripted_game(fen=START_FEN, moves=200, seed=0):
+    """Play random moves through the same calls the interface makes; return the plies played.
+
+    Like a player, it selects a piece, asks for its possible moves and
+    capturable pieces, and then moves it, promoting to a queen.
+    """
+    rng = random.Random(seed)
+    position = Position.from_fen(fen)
+    squares = [(row, col) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
+    plies = 0
+    while plies < moves and not position.game_over:
+        own = [pos for pos in squares if position.piece_at(pos)[1:] == position.turn]
+        rng.shuffle(own)
+        for pos in own:
+            targets = position.get_possible_moves(pos)
+            position.get_capturable_pieces(pos)
+            if targets:
+                position.move_piece(pos, rng.choice(targets))
+                if position.promoting_pawn:
+                    position.promote_pawn('D')
+                break
+        plies += 1
+    return plies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the rules engine over a scripted random game.')
+    parser.add_argument('--fen', default=START_FEN, help='start position')
+    parser.add_argument('--moves', type=int, default=200, help='maximum plies to play')
+    parser.add_argument('--games', type=int, default=1, help='number of games, seeds counting up from --seed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allocations', action='store_true', help='also record memory allocated per function')
+    parser.add_argument('--sort', choices=['own', 'total', 'calls', 'allocated'], default='own')
+    parser.add_argument('--limit', type=int, help='show only the first rows of the table')
+    parser.add_argument('--folded', metavar='PATH', help='write folded stacks for a flame graph')
+    parser.add_argument('--profile', metavar='PATH', help='also run the games under cProfile and save its stats')
+    args = parser.parse_args(argv)
+
+    seeds = range(args.seed, args.seed + args.games)
+    enable(allocations=args.allocations)
+    start = time.perf_counter()
+    try:
+        plies = sum(play_scripted_game(args.fen, args.moves, seed) for seed in seeds)
+    finally:
+        disable()
+    elapsed = time.perf_counter() - start
+    print(report(args.sort, args.limit))
+    print(f'{plies} plies in {elapsed:.2f}s with instrumentation')
+
+    if args.folded:
+        with open(args.folded, 'w', encoding='utf-8') as out:
+            write_folded(out)
+    if args.profile:
+        # A separate pass, so the wrappers do not show up in the profile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        for seed in seeds:
+            play_scripted_game(args.fen, args.moves, seed)
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f'cProfile stats written to {args.profile} (python -m pstats {args.profile})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
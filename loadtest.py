@@ -0,0 +1,120 @@
+"""Load test for server.py: many connections playing random games at once.
+
+Every connection starts a game, takes both colours and plays random legal
+moves, waiting for each reply before sending the next move. For each
+connection count the run reports moves per second across all connections
+and the median and 99th percentile time from sending a move to its reply.
+Unless --port is given, a server is started in a child process.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+from rules import Position, move_name
+
+
+class Client:
+    """One connection with one request in flight at a time."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+
+    async def request(self, message):
+        """Send a request and return its reply, skipping the game updates in between."""
+        self.next_id += 1
+        message['id'] = self.next_id
+        self.writer.write((json.dumps(message) + '\n').encode())
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('server closed the connection')
+            reply = json.loads(line)
+            if reply.get('id') == self.next_id:
+                if reply['type'] == 'error':
+                    raise RuntimeError(f"{message['op']}: {reply['error']}")
+                return reply
+
+
+async def play(host, port, deadline, latencies, seed, max_plies):
+    """Play random games on one connection until deadline; return the moves played."""
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    client = Client(reader, writer)
+    moves = 0
+    try:
+        while time.perf_counter() < deadline:
+            game = (await client.request({'op': 'new'}))['game']
+            await client.request({'op': 'join', 'game': game})
+            position = Position()
+            while not position.game_over and len(position.history) < max_plies \
+                    and time.perf_counter() < deadline:
+                move = rng.choice(position.legal_moves())
+                start = time.perf_counter()
+                await client.request({'op': 'move', 'game': game, 'move': move_name(move)})
+                latencies.append(time.perf_counter() - start)
+                position.play_move(move)
+                moves += 1
+            await client.request({'op': 'leave', 'game': game})
+    finally:
+        writer.close()
+    return moves
+
+
+def percentile(values, fraction):
+    """Return the value below which fraction of the sorted values fall."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_level(host, port, connections, duration, max_plies):
+    """Run one connection count and return (moves, seconds, sorted latencies)."""
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + duration
+    counts = await asyncio.gather(*(play(host, port, deadline, latencies, seed, max_plies)
+                                    for seed in range(connections)))
+    return sum(counts), time.perf_counter() - start, sorted(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure server.py throughput and latency.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='use a running server instead of starting one')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='connection counts to measure')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per connection count')
+    parser.add_argument('--max-plies', type=int, default=200, help='start a new game after this many plies')
+    args = parser.parse_args(argv)
+
+    server = None
+    host, port = args.host, args.port
+    if port is None:
+        server = subprocess.Popen([sys.executable, 'server.py', '--host', host, '--port', '0'],
+                                  stdout=subprocess.PIPE, text=True, cwd=sys.path[0] or None)
+        # The server prints 'listening on host:port' once it accepts connections
+        port = int(server.stdout.readline().rsplit(':', 1)[1])
+
+    try:
+        print(f'{"connections":>11}{"moves":>10}{"moves/s":>11}{"p50 ms":>9}{"p99 ms":>9}')
+        for connections in args.connections:
+            moves, elapsed, latencies = asyncio.run(
+                run_level(host, port, connections, args.duration, args.max_plies))
+            print(f'{connections:>11}{moves:>10}{moves / elapsed:>11,.0f}'
+                  f'{percentile(latencies, 0.5) * 1e3:>9.2f}{percentile(latencies, 0.99) * 1e3:>9.2f}',
+                  flush=True)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
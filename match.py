@@ -0,0 +1,362 @@
+"""Headless matches between move-selection policies, played across a process pool.
+
+A policy is named by a spec string:
+
+    random                   a uniformly random legal move
+    greedy                   the most valuable capture (cheapest capturer first), else random
+    engine:depth=3,ms=200    the alpha-beta engine with a depth and/or time limit per move
+    package.module:function  a plug-in called as function(position, rng) that returns a move
+
+Games come in pairs from the same randomised opening with colours swapped.
+A game ends by the rules, or is adjudicated: a draw after --max-plies, a
+win once one side's static evaluation stays beyond --resign-score for
+--resign-plies plies, or at once by the endgame tables when --tablebase
+is given. Results stream out as JSON lines while the match runs, and the
+summary gives the first policy's score, Elo difference and, optionally,
+a sequential probability ratio test that can stop the match early.
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from engine import PIECE_VALUES, Searcher, evaluate
+from rules import START_FEN, TYPE_MASK, Position, move_name
+
+Adjudication = namedtuple('Adjudication', 'max_plies resign_score resign_plies tablebase')
+DEFAULT_ADJUDICATION = Adjudication(300, 1000, 8, None)
+RESULT_SCORES = {'1-0': 1.0, '1/2-1/2': 0.5, '0-1': 0.0}
+
+
+def random_policy(position, rng):
+    return rng.choice(position.legal_moves())
+
+
+def greedy_policy(position, rng):
+    """Capture the most valuable piece with the least valuable attacker; move at random otherwise."""
+    board = position.board
+    best = []
+    best_value = 0
+    for move in position.legal_moves():
+        target = position._captured_square(move)
+        value = 0
+        if target:
+            value = PIECE_VALUES[board[target] & TYPE_MASK] * 10 - PIECE_VALUES[board[move[0]] & TYPE_MASK] // 100
+        value += PIECE_VALUES[move[2]]
+        if value > best_value:
+            best, best_value = [move], value
+        elif value == best_value:
+            best.append(move)
+    return rng.choice(best or position.legal_moves())
+
+
+class EnginePolicy:
+    """The alpha-beta engine, with its own searcher kept between moves."""
+
+    def __init__(self, depth=None, ms=None, hash_mb=16):
+        self.depth = depth
+        self.ms = ms
+        self.searcher = Searcher(hash_mb)
+
+    def __call__(self, position, rng):
+        return self.searcher.search(position, self.ms, self.depth).move
+
+
+def make_policy(spec):
+    """Return the policy function described by a spec string."""
+    name, _, options = spec.partition(':')
+    if name == 'random' and not options:
+        return random_policy
+    if name == 'greedy' and not options:
+        return greedy_policy
+    if name == 'engine':
+        settings = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if key not in ('depth', 'ms', 'hash_mb') or not value.isdigit():
+                raise ValueError(f"Unknown engine option '{option}' in '{spec}'")
+            settings[key] = int(value)
+        if 'depth' not in settings and 'ms' not in settings:
+            settings['depth'] = 2
+        return EnginePolicy(**settings)
+    if options:
+        try:
+            return getattr(importlib.import_module(name), options)
+        except (ImportError, AttributeError) as exc:
+            raise ValueError(f"Cannot load policy '{spec}': {exc}") from None
+    raise ValueError(f"Unknown policy '{spec}'")
+
+
+# Policies and tables of this process, built on first use
+_policies = {}
+_tablebases = {}
+
+
+def _policy(spec):
+    if spec not in _policies:
+        _policies[spec] = make_policy(spec)
+    return _policies[spec]
+
+
+def _tablebase(directory):
+    if directory not in _tablebases:
+        from tablebase import Tablebase
+
+        _tablebases[directory] = Tablebase(directory)
+    return _tablebases[directory]
+
+
+def make_opening(rng, fen=START_FEN, plies=0):
+    """Return the FEN reached by playing plies random moves from fen, staying out of finished games."""
+    for _ in range(100):
+        position = Position.from_fen(fen)
+        for _ in range(plies):
+            if position.game_over:
+                break
+            position.play_move(rng.choice(position.legal_moves()))
+        if not position.game_over:
+            return position.to_fen()
+    return fen
+
+
+def play_game(white, black, fen=START_FEN, seed=0, adjudication=DEFAULT_ADJUDICATION):
+    """Play one game between two policy specs and return its result dict."""
+    rng = random.Random(seed)
+    position = Position.from_fen(fen)
+    policies = {'b': _policy(white), 'p': _policy(black)}
+    tablebase = _tablebase(adjudication.tablebase) if adjudication.tablebase else None
+    moves = []
+    result = reason = None
+    leader_plies = 0
+    leader = None
+
+    while result is None:
+        if position.game_over:
+            result = {'Brancas': '1-0', 'Pretas': '0-1'}.get(position.winner, '1/2-1/2')
+            reason = position.end_reason
+            break
+        if len(moves) >= adjudication.max_plies:
+            result, reason = '1/2-1/2', 'max plies'
+            break
+        if tablebase:
+            probe = tablebase.probe(position)
+            if probe:
+                outcome = probe[0]
+                if outcome == 'draw':
+                    result = '1/2-1/2'
+                else:
+                    result = '1-0' if (outcome == 'win') == (position.turn == 'b') else '0-1'
+                reason = 'tablebase'
+                break
+        if adjudication.resign_score:
+            score = evaluate(position) if position.turn == 'b' else -evaluate(position)
+            ahead = '1-0' if score >= adjudication.resign_score else \
+                '0-1' if score <= -adjudication.resign_score else None
+            leader_plies = leader_plies + 1 if ahead and ahead == leader else 1 if ahead else 0
+            leader = ahead
+            if ahead and leader_plies >= adjudication.resign_plies:
+                result, reason = ahead, 'resign'
+                break
+
+        move = policies[position.turn](position, rng)
+        if move is None or not position.play_move(move):
+            result = '0-1' if position.turn == 'b' else '1-0'
+            reason = f"illegal move {move_name(move) if move else 'none'}"
+            break
+        moves.append(move_name(move))
+
+    return {'white': white, 'black': black, 'opening': fen, 'result': result, 'reason': reason,
+            'plies': len(moves), 'moves': ' '.join(moves)}
+
+
+def _play_task(task):
+    index, white, black, fen, seed, adjudication = task
+    return {'game': index, **play_game(white, black, fen, seed, adjudication)}
+
+
+def elo(score):
+    """Return the Elo difference matching an expected score."""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def match_stats(wins, draws, losses):
+    """Return a dict of score, Elo difference with a 95% margin, and likelihood of superiority."""
+    games = wins + draws + losses
+    if not games:
+        return {'games': 0}
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    decisive = wins + losses
+    return {
+        'games': games, 'wins': wins, 'draws': draws, 'losses': losses, 'score': score,
+        'elo': elo(score), 'elo_low': elo(score - margin), 'elo_high': elo(score + margin),
+        'los': 0.5 * (1 + math.erf((wins - losses) / math.sqrt(2 * decisive))) if decisive else 0.5,
+    }
+
+
+def sprt(wins, draws, losses, elo0, elo1, alpha=0.05, beta=0.05):
+    """Return (log-likelihood ratio, lower bound, upper bound) of H1: elo1 against H0: elo0.
+
+    Uses the usual normal approximation of the trinomial GSPRT; accept H1
+    once the ratio is above the upper bound and H0 once it is below the lower.
+    Half a game is added to each outcome when estimating the variance, so
+    one-sided results still give a finite ratio.
+    """
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+    if not games:
+        return 0.0, lower, upper
+    score = (wins + draws / 2) / games
+    padded = (wins + 0.5, draws + 0.5, losses + 0.5)
+    mean = (padded[0] + padded[1] / 2) / (games + 1.5)
+    variance = (padded[0] * (1 - mean) ** 2 + padded[1] * (0.5 - mean) ** 2 + padded[2] * mean ** 2) / (games + 1.5)
+    score0 = 1 / (1 + 10 ** (-elo0 / 400))
+    score1 = 1 / (1 + 10 ** (-elo1 / 400))
+    llr = games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+    return llr, lower, upper
+
+
+def schedule(first, second, games, seed=0, openings=(START_FEN,), opening_plies=0,
+             adjudication=DEFAULT_ADJUDICATION):
+    """Yield game tasks: pairs from one random opening, first playing white in the even games."""
+    rng = random.Random(seed)
+    for pair in range((games + 1) // 2):
+        fen = make_opening(rng, openings[pair % len(openings)], opening_plies)
+        for index in (2 * pair, 2 * pair + 1):
+            if index < games:
+                white, black = (first, second) if index % 2 == 0 else (second, first)
+                yield index, white, black, fen, rng.getrandbits(32), adjudication
+
+
+def run_match(tasks, workers=1, stop=None):
+    """Yield the result of every task as games finish, stopping early once stop() is true.
+
+    At most two games per worker are queued; with one worker games run in
+    this process.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield _play_task(task)
+            if stop and stop():
+                return
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        tasks = iter(tasks)
+        pending = set()
+        while True:
+            while len(pending) < workers * 2 and not (stop and stop()):
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.add(executor.submit(_play_task, task))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            if stop and stop():
+                for future in pending:
+                    future.cancel()
+                for future in pending:
+                    if not future.cancelled():
+                        yield future.result()
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play a headless match between two move-selection policies.')
+    parser.add_argument('first', help="policy spec: random, greedy, engine:depth=N,ms=N or module:function")
+    parser.add_argument('second', help='opponent policy spec')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--openings', metavar='PATH', help='file of start FENs, one per line')
+    parser.add_argument('--opening-plies', type=int, default=4, help='random plies played from each start')
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_ADJUDICATION.max_plies,
+                        help='adjudicate a draw after this many plies')
+    parser.add_argument('--resign-score', type=int, default=DEFAULT_ADJUDICATION.resign_score,
+                        help='static evaluation in centipawns that counts as a won game (0 to disable)')
+    parser.add_argument('--resign-plies', type=int, default=DEFAULT_ADJUDICATION.resign_plies,
+                        help='plies the evaluation must stay past --resign-score')
+    parser.add_argument('--tablebase', metavar='DIR', help='adjudicate positions covered by these tables')
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'),
+                        help='stop once a SPRT decides between these Elo differences')
+    parser.add_argument('--output', '-o', help='write one JSON line per game here')
+    parser.add_argument('--progress', type=int, default=10, metavar='GAMES',
+                        help='report on stderr every GAMES games (0 to disable)')
+    args = parser.parse_args(argv)
+
+    for spec in (args.first, args.second):
+        make_policy(spec)
+    openings = [START_FEN]
+    if args.openings:
+        with open(args.openings, encoding='utf-8') as stream:
+            openings = [line.strip() for line in stream if line.strip() and not line.startswith('#')]
+    adjudication = Adjudication(args.max_plies, args.resign_score, args.resign_plies, args.tablebase)
+    tasks = schedule(args.first, args.second, args.games, args.seed, openings, args.opening_plies, adjudication)
+
+    counts = {1.0: 0, 0.5: 0, 0.0: 0}
+    decision = None
+    decided_at = 0
+
+    def stop():
+        return decision is not None
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else None
+    start = time.perf_counter()
+    played = 0
+    try:
+        for result in run_match(tasks, args.workers, stop):
+            played += 1
+            score = RESULT_SCORES[result['result']]
+            # schedule() gives the first policy white in the even games, which also holds in self-play
+            counts[score if result['game'] % 2 == 0 else 1 - score] += 1
+            if out:
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+            if args.sprt and decision is None:
+                llr, lower, upper = sprt(counts[1.0], counts[0.5], counts[0.0], *args.sprt)
+                if llr >= upper:
+                    decision = 'H1'
+                elif llr <= lower:
+                    decision = 'H0'
+                decided_at = played
+            if args.progress and played % args.progress == 0:
+                elapsed = time.perf_counter() - start
+                print(f'{played} games  +{counts[1.0]} ={counts[0.5]} -{counts[0.0]}  '
+                      f'{played / elapsed:.2f} games/s', file=sys.stderr)
+    finally:
+        if out:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    stats = match_stats(counts[1.0], counts[0.5], counts[0.0])
+    print(f'{args.first} vs {args.second}: {played} games in {elapsed:.1f}s '
+          f'({played / max(elapsed, 1e-9):.2f} games/s)')
+    if played:
+        print(f"+{stats['wins']} ={stats['draws']} -{stats['losses']}  score {100 * stats['score']:.1f}%  "
+              f"Elo {stats['elo']:+.0f} [{stats['elo_low']:+.0f}, {stats['elo_high']:+.0f}]  "
+              f"LOS {100 * stats['los']:.1f}%")
+    if args.sprt:
+        llr, lower, upper = sprt(counts[1.0], counts[0.5], counts[0.0], *args.sprt)
+        verdicts = {'H1': f'accepted H1 (Elo >= {args.sprt[1]:g})', 'H0': f'accepted H0 (Elo <= {args.sprt[0]:g})'}
+        if decision:
+            # Games already running when the test stopped still count in the score above
+            verdict = f'{verdicts[decision]} after {decided_at} games'
+        else:
+            verdict = 'inconclusive'
+        print(f'SPRT LLR {llr:.2f} [{lower:.2f}, {upper:.2f}]: {verdict}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""Compact binary files of positions and games, read through mmap.
+
+Positions are fixed 32-byte records: an occupancy bitboard (bit 0 = a8,
+bit 63 = h1), one 4-bit piece code per occupied square in bit order (the
+board's own piece codes fit in a nibble), then side to move, castling
+rights, en passant square and the move counters.
+
+Games store one byte per move: its index in the sorted list of legal
+moves, which never has more than 218 entries. An index of game offsets
+at the end of the file gives random access by game number. Readers map
+the file and hand out memoryview slices, so nothing is copied until a
+record is decoded.
+"""
+import argparse
+import mmap
+import struct
+import sys
+import time
+from array import array
+
+from rules import COLOR_MASK, COLOR_NAMES, EMPTY, KING, OFFBOARD, SQUARES, START_FEN, TYPE_MASK, Position
+
+POSITION_RECORD = struct.Struct('<Q16sBBBH3x')
+POSITION_SIZE = POSITION_RECORD.size
+
+POSITION_MAGIC = b'XPOS'
+GAME_MAGIC = b'XGAM'
+FORMAT_VERSION = 1
+POSITION_HEADER = struct.Struct('<4sHHQ')
+GAME_HEADER = struct.Struct('<4sHHQQ')
+GAME_RECORD = struct.Struct('<HBB')
+OFFSET = struct.Struct('<Q')
+
+RESULT_CODES = {'*': 0, '1-0': 1, '0-1': 2, '1/2-1/2': 3}
+RESULT_NAMES = {code: result for result, code in RESULT_CODES.items()}
+CUSTOM_START = 1
+
+# Square index of each mailbox square, and an empty mailbox to copy when decoding
+SQUARE_INDEX = {sq: index for index, sq in enumerate(SQUARES)}
+EMPTY_BOARD = bytearray([OFFBOARD]) * 120
+for _sq in SQUARES:
+    EMPTY_BOARD[_sq] = EMPTY
+
+
+def pack_position(position):
+    """Return the 32-byte record of a Position."""
+    board = position.board
+    occupancy = 0
+    nibbles = bytearray(16)
+    count = 0
+    for index, sq in enumerate(SQUARES):
+        piece = board[sq]
+        if piece != EMPTY:
+            occupancy |= 1 << index
+            nibbles[count >> 1] |= piece << (4 * (count & 1))
+            count += 1
+    ep_square = SQUARE_INDEX[position.ep_square] + 1 if position.ep_square else 0
+    return POSITION_RECORD.pack(occupancy, bytes(nibbles), (position.turn == 'p') | position.castling << 1,
+                                ep_square, min(position.halfmove_clock, 255), position.fullmove_number)
+
+
+def unpack_position(record, position=None, game_state=True):
+    """Set up a Position from a 32-byte record, reusing position when given.
+
+    With game_state=False the check, mate and draw flags are not computed,
+    which makes decoding several times faster.
+    """
+    occupancy, nibbles, flags, ep_square, halfmove_clock, fullmove_number = \
+        POSITION_RECORD.unpack_from(record)
+    if position is None:
+        position = Position.__new__(Position)
+    position.check = {'b': False, 'p': False}
+
+    board = EMPTY_BOARD[:]
+    king_positions = {}
+    count = 0
+    while occupancy:
+        low = occupancy & -occupancy
+        sq = SQUARES[low.bit_length() - 1]
+        piece = nibbles[count >> 1] >> (4 * (count & 1)) & 0xF
+        board[sq] = piece
+        if piece & TYPE_MASK == KING:
+            king_positions[COLOR_NAMES[piece & COLOR_MASK]] = sq
+        occupancy ^= low
+        count += 1
+
+    position.board = board
+    position.king_positions = king_positions
+    position.turn = 'p' if flags & 1 else 'b'
+    position.castling = flags >> 1
+    position.ep_square = SQUARES[ep_square - 1] if ep_square else 0
+    position.halfmove_clock = halfmove_clock
+    position.fullmove_number = fullmove_number
+    position.reset_game_state(game_state)
+    return position
+
+
+def encode_move(position, move):
+    """Return the one-byte index of a legal move in position."""
+    return sorted(position.legal_moves()).index(move)
+
+
+def decode_move(position, index):
+    """Return the legal move stored as index for position."""
+    return sorted(position.legal_moves())[index]
+
+
+class PositionWriter:
+    """Appends position records to a file and fills in the count on close."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.count = 0
+        self.file.write(POSITION_HEADER.pack(POSITION_MAGIC, FORMAT_VERSION, POSITION_SIZE, 0))
+
+    def write(self, position):
+        self.file.write(pack_position(position))
+        self.count += 1
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(POSITION_HEADER.pack(POSITION_MAGIC, FORMAT_VERSION, POSITION_SIZE, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameWriter:
+    """Appends games to a file, then writes the offset index and header on close."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.offsets = array('Q')
+        self.file.write(GAME_HEADER.pack(GAME_MAGIC, FORMAT_VERSION, 0, 0, 0))
+
+    def write(self, moves, result='*', fen=START_FEN):
+        """Append a game given as (start, end, promotion) moves from fen.
+
+        Every move is encoded before anything is written, so a game with an
+        illegal move raises ValueError and leaves the file untouched.
+        """
+        position = Position.from_fen(fen)
+        custom_start = fen != START_FEN
+        start = pack_position(position) if custom_start else b''
+        encoded = bytearray(len(moves))
+        for ply, move in enumerate(moves):
+            encoded[ply] = encode_move(position, move)
+            position.make_move(move)
+
+        self.offsets.append(self.file.tell())
+        flags = CUSTOM_START if custom_start else 0
+        self.file.write(GAME_RECORD.pack(len(moves), RESULT_CODES.get(result, 0), flags))
+        self.file.write(start)
+        self.file.write(encoded)
+
+    def write_game(self, game):
+        """Append a pgn.Game."""
+        self.write(game.moves, game.result, game.headers.get('FEN', START_FEN))
+
+    def close(self):
+        index_offset = self.file.tell()
+        self.file.write(self.offsets.tobytes() if sys.byteorder == 'little'
+                        else b''.join(OFFSET.pack(offset) for offset in self.offsets))
+        self.file.seek(0)
+        self.file.write(GAME_HEADER.pack(GAME_MAGIC, FORMAT_VERSION, 0, len(self.offsets), index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _MappedFile:
+    """Read-only mmap of a whole file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # records still in use keep the mapping alive until they are released
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PositionFile(_MappedFile):
+    """Random access to a file of position records."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        magic, version, record_size, self.count = POSITION_HEADER.unpack_from(self.view)
+        if magic != POSITION_MAGIC or version != FORMAT_VERSION or record_size != POSITION_SIZE:
+            self.close()
+            raise ValueError(f"'{path}' is not a position file of version {FORMAT_VERSION}")
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        """Return the raw 32-byte record of position index, without copying."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = POSITION_HEADER.size + index * POSITION_SIZE
+        return self.view[start:start + POSITION_SIZE]
+
+    def __getitem__(self, index):
+        return unpack_position(self.record(index))
+
+    def positions(self, game_state=True):
+        """Yield every position, reusing one Position object for speed."""
+        position = None
+        for index in range(self.count):
+            position = unpack_position(self.record(index), position, game_state)
+            yield position
+
+    def __iter__(self):
+        return self.positions()
+
+
+class GameFile(_MappedFile):
+    """Random access to a file of games."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        magic, version, _, self.count, self.index_offset = GAME_HEADER.unpack_from(self.view)
+        if magic != GAME_MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"'{path}' is not a game file of version {FORMAT_VERSION}")
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        """Return (start position record or None, encoded moves, result) of game index, without copying."""
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset = OFFSET.unpack_from(self.view, self.index_offset + index * OFFSET.size)[0]
+        length, result, flags = GAME_RECORD.unpack_from(self.view, offset)
+        offset += GAME_RECORD.size
+        start = None
+        if flags & CUSTOM_START:
+            start = self.view[offset:offset + POSITION_SIZE]
+            offset += POSITION_SIZE
+        return start, self.view[offset:offset + length], RESULT_NAMES[result]
+
+    def start_position(self, index):
+        """Return the position game index starts from."""
+        start, _, _ = self.record(index)
+        return unpack_position(start) if start is not None else Position()
+
+    def moves(self, index):
+        """Return the (start, end, promotion) moves of game index."""
+        position = self.start_position(index)
+        moves = []
+        for encoded in self.record(index)[1]:
+            move = decode_move(position, encoded)
+            position.make_move(move)
+            moves.append(move)
+        return moves
+
+    def positions(self, index):
+        """Yield the position after each move of game index (the same object, updated in place)."""
+        position = self.start_position(index)
+        for encoded in self.record(index)[1]:
+            position.make_move(decode_move(position, encoded))
+            yield position
+
+    def game(self, index):
+        """Return game index as a pgn.Game."""
+        from pgn import Game
+
+        start, _, result = self.record(index)
+        headers = {'Result': result}
+        if start is not None:
+            headers.update(SetUp='1', FEN=unpack_position(start).to_fen())
+        return Game(headers, self.moves(index), result)
+
+    def __getitem__(self, index):
+        return self.game(index)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.game(index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert games and positions to the packed binary format.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    games = commands.add_parser('games', help='pack a PGN file into a game file')
+    games.add_argument('input')
+    games.add_argument('output')
+    positions = commands.add_parser('positions', help='pack a file of FEN lines into a position file')
+    positions.add_argument('input')
+    positions.add_argument('output')
+    info = commands.add_parser('info', help='describe a packed file and time a full read')
+    info.add_argument('path')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == 'games':
+        from pgn import open_pgn, read_games
+
+        skipped = 0
+        with open_pgn(args.input) as stream, GameWriter(args.output) as writer:
+            for game in read_games(stream):
+                if game.error:
+                    skipped += 1
+                    continue
+                writer.write_game(game)
+        print(f'{len(writer.offsets)} games packed, {skipped} skipped with errors '
+              f'in {time.perf_counter() - start:.2f}s')
+    elif args.command == 'positions':
+        from pgn import open_pgn
+
+        with open_pgn(args.input) as stream, PositionWriter(args.output) as writer:
+            for line in stream:
+                if line.strip():
+                    writer.write(Position.from_fen(line))
+        print(f'{writer.count} positions packed in {time.perf_counter() - start:.2f}s')
+    else:
+        with open(args.path, 'rb') as file:
+            magic = file.read(4)
+        if magic == GAME_MAGIC:
+            plies = 0
+            with GameFile(args.path) as games:
+                size = len(games.view)
+                count = len(games)
+                for index in range(count):
+                    for _ in games.positions(index):
+                        plies += 1
+            elapsed = time.perf_counter() - start
+            print(f'{count} games, {plies} moves, {size / max(count, 1):.1f} bytes/game; '
+                  f'replayed in {elapsed:.2f}s ({plies / max(elapsed, 1e-9):,.0f} positions/s)')
+        else:
+            with PositionFile(args.path) as positions:
+                count = len(positions)
+                for _ in positions.positions(game_state=False):
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f'{count} positions of {POSITION_SIZE} bytes; '
+                  f'decoded in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f} positions/s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
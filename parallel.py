@@ -0,0 +1,158 @@
+"""Multi-process search: Lazy SMP over a shared transposition table and batch analysis."""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Searcher, SearchResult, TranspositionTable
+from rules import START_FEN, Position, move_name
+
+# Positions used when measuring how throughput scales with the number of workers
+BENCHMARK_FENS = [
+    START_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+    'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3',
+    '2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 1',
+]
+
+# Per-process search state, set up by the pool initializers
+_searcher = None
+_stop_flag = None
+
+
+def _init_smp_worker(tt_array, stop_flag):
+    """Attach a worker process to the shared table and stop flag."""
+    global _searcher, _stop_flag
+    _searcher = Searcher(tt=TranspositionTable(buffer=memoryview(tt_array).cast('B')))
+    _searcher.should_stop = lambda: stop_flag.value
+    _stop_flag = stop_flag
+
+
+def _smp_search(position, time_ms, max_depth, first_depth, age):
+    """Run one Lazy SMP helper and tell the others to stop once it finishes."""
+    _searcher.tt.age = age
+    result = _searcher.search(position, time_ms, max_depth, first_depth=first_depth, new_search=False)
+    _stop_flag.value = 1
+    return result
+
+
+def _init_batch_worker(hash_mb):
+    """Give a batch worker process its own searcher."""
+    global _searcher
+    _searcher = Searcher(hash_mb)
+
+
+def _batch_search(item, time_ms, max_depth):
+    """Search one batch item, given as a FEN string or a Position.
+
+    The worker's table is kept between items: each search ages the entries
+    of the previous ones, so they are reused where positions meet and
+    replaced first otherwise.
+    """
+    position = Position.from_fen(item) if isinstance(item, str) else item
+    return _searcher.search(position, time_ms, max_depth)
+
+
+class ParallelSearcher:
+    """Lazy SMP: every worker searches the same position and shares one transposition table.
+
+    Workers meet each other's results through the table; odd workers start
+    one ply deeper so they do not all walk the tree in lockstep. The deepest
+    completed result wins. The pool and the table live as long as the object,
+    so consecutive searches pay no process start-up cost.
+    """
+
+    def __init__(self, workers=None, hash_mb=64):
+        """Start workers processes (all cores by default) sharing hash_mb of table."""
+        self.workers = workers or os.cpu_count() or 1
+        self.tt_array = multiprocessing.RawArray('B', int(hash_mb * 1024 * 1024))
+        self.tt = TranspositionTable(buffer=memoryview(self.tt_array).cast('B'))
+        self.stop_flag = multiprocessing.RawValue('b', 0)
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_smp_worker,
+                                            initargs=(self.tt_array, self.stop_flag))
+
+    def search(self, position, time_ms=1000, max_depth=None):
+        """Search position on every worker and return the deepest SearchResult, nodes summed."""
+        self.tt.new_search()
+        self.stop_flag.value = 0
+        start = time.perf_counter()
+        futures = [self.executor.submit(_smp_search, position, time_ms, max_depth, 1 + index % 2, self.tt.age)
+                   for index in range(self.workers)]
+        results = [future.result() for future in futures]
+        best = max(results, key=lambda result: result.depth)
+        nodes = sum(result.nodes for result in results)
+        return SearchResult(best.move, best.score, best.depth, nodes, time.perf_counter() - start)
+
+    def close(self):
+        """Shut the worker processes down."""
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def analyse_batch(positions, workers=None, time_ms=None, max_depth=4, hash_mb=16):
+    """Search many positions (FEN strings or Positions) concurrently; results keep the input order."""
+    positions = list(positions)
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(positions) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_init_batch_worker, initargs=(hash_mb,)) as executor:
+        return list(executor.map(_batch_search, positions, [time_ms] * len(positions),
+                                 [max_depth] * len(positions), chunksize=chunksize))
+
+
+def measure_scaling(positions, worker_counts, max_depth=4, repeat=1):
+    """Return (workers, seconds, positions/s, nodes/s, speedup) for each worker count."""
+    positions = list(positions) * repeat
+    rows = []
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = analyse_batch(positions, workers, max_depth=max_depth)
+        elapsed = time.perf_counter() - start
+        nodes = sum(result.nodes for result in results)
+        if baseline is None:
+            baseline = elapsed
+        rows.append((workers, elapsed, len(positions) / elapsed, nodes / elapsed, baseline / elapsed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel search and batch analysis.')
+    parser.add_argument('--fen', default=START_FEN, help='position for a Lazy SMP search')
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count() or 1],
+                        help='worker count (several values with --scaling)')
+    parser.add_argument('--time-ms', type=int, default=2000, help='time per Lazy SMP search')
+    parser.add_argument('--depth', type=int, default=None, help='maximum depth')
+    parser.add_argument('--hash-mb', type=int, default=64, help='shared transposition table size')
+    parser.add_argument('--scaling', action='store_true',
+                        help='analyse the benchmark positions once per worker count and report scaling')
+    parser.add_argument('--repeat', type=int, default=2, help='copies of the benchmark set for --scaling')
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        print(f'{"workers":>7} {"seconds":>8} {"pos/s":>8} {"nodes/s":>10} {"speedup":>8}')
+        for workers, elapsed, pps, nps, speedup in measure_scaling(
+                BENCHMARK_FENS, args.workers, args.depth or 4, args.repeat):
+            print(f'{workers:>7} {elapsed:>8.2f} {pps:>8.2f} {nps:>10,.0f} {speedup:>7.2f}x')
+        return 0
+
+    with ParallelSearcher(args.workers[0], args.hash_mb) as searcher:
+        result = searcher.search(Position.from_fen(args.fen), args.time_ms, args.depth)
+    move = move_name(result.move) if result.move else '-'
+    print(f'bestmove {move} score {result.score} depth {result.depth} nodes {result.nodes} '
+          f'nps {result.nodes / max(result.seconds, 1e-9):,.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
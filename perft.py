@@ -0,0 +1,132 @@
+"""Perft: count leaf nodes of the legal move tree to verify and benchmark move generation."""
+import argparse
+import sys
+import time
+
+from bitboard import BACKENDS
+from rules import START_FEN, Position, move_name
+
+# Standard perft positions with published node counts for depths 1, 2, 3...
+REFERENCE_POSITIONS = [
+    ('start', START_FEN, [20, 400, 8902, 197281]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890]),
+]
+
+
+def perft(position, depth):
+    """Return the number of leaf nodes depth plies below position."""
+    moves = position.generate_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    """Return {move name: leaf count} for every root move, for locating generator bugs."""
+    counts = {}
+    for move in position.generate_moves():
+        position.make_move(move)
+        counts[move_name(move)] = perft(position, depth - 1)
+        position.unmake_move()
+    return counts
+
+
+def timed_perft(position, depth):
+    """Run perft and return (nodes, seconds)."""
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    return nodes, time.perf_counter() - start
+
+
+def run_suite(max_depth=None, out=sys.stdout, position_class=Position):
+    """Check every reference position and return the number of mismatches."""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected_counts in REFERENCE_POSITIONS:
+        position = position_class.from_fen(fen)
+        for depth, expected in enumerate(expected_counts, start=1):
+            if max_depth is not None and depth > max_depth:
+                break
+            nodes, elapsed = timed_perft(position, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == expected else f'MISMATCH (expected {expected})'
+            if nodes != expected:
+                failures += 1
+            print(f'{name:<10} depth {depth}  {nodes:>10}  {format_nps(nodes, elapsed):>12}  {status}',
+                  file=out)
+    print(f'total {total_nodes} nodes in {total_time:.2f}s, {format_nps(total_nodes, total_time)}, '
+          f'{failures} failure(s)', file=out)
+    return failures
+
+
+def compare_backends(depth, out=sys.stdout):
+    """Time perft on every reference position with each backend and return the mismatch count."""
+    failures = 0
+    names = list(BACKENDS)
+    print(f'{"position":<10} {"nodes":>9}  ' + '  '.join(f'{name:>14}' for name in names) + '  speedup',
+          file=out)
+    totals = dict.fromkeys(names, 0.0)
+    for name, fen, expected_counts in REFERENCE_POSITIONS:
+        position_depth = min(depth, len(expected_counts))
+        expected = expected_counts[position_depth - 1]
+        times = {}
+        for backend in names:
+            nodes, times[backend] = timed_perft(BACKENDS[backend].from_fen(fen), position_depth)
+            totals[backend] += times[backend]
+            if nodes != expected:
+                failures += 1
+                print(f'{name}: {backend} counted {nodes}, expected {expected}', file=out)
+        print(f'{name:<10} {expected:>9}  ' + '  '.join(f'{format_nps(expected, times[backend]):>14}'
+                                                       for backend in names)
+              + f'  {times[names[0]] / times[names[-1]]:>6.2f}x', file=out)
+    print('total time ' + ', '.join(f'{backend} {totals[backend]:.2f}s' for backend in names), file=out)
+    return failures
+
+
+def format_nps(nodes, seconds):
+    """Format a node count over time as nodes per second."""
+    return f'{nodes / seconds:,.0f} nps' if seconds > 0 else '- nps'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft node counts for the rules engine.')
+    parser.add_argument('--fen', default=START_FEN, help='position to count from')
+    parser.add_argument('--depth', type=int, default=4, help='depth in plies')
+    parser.add_argument('--divide', action='store_true', help='show counts per root move')
+    parser.add_argument('--suite', action='store_true', help='run the reference positions')
+    parser.add_argument('--backend', choices=BACKENDS, default='mailbox', help='move generator to use')
+    parser.add_argument('--compare', action='store_true',
+                        help='time every backend on the reference positions at --depth')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare_backends(args.depth) else 0
+    if args.suite:
+        return 1 if run_suite(args.depth, position_class=BACKENDS[args.backend]) else 0
+
+    position = BACKENDS[args.backend].from_fen(args.fen)
+    if args.divide:
+        for name, nodes in sorted(divide(position, args.depth).items()):
+            print(f'{name}: {nodes}')
+    nodes, elapsed = timed_perft(position, args.depth)
+    print(f'depth {args.depth}: {nodes} nodes in {elapsed:.2f}s ({format_nps(nodes, elapsed)})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""PGN reading and writing on top of the rules engine.
+
+read_games() walks a file line by line and yields one Game at a time, so
+memory use stays flat however large the database is.
+"""
+import bz2
+import gzip
+import re
+
+from rules import (
+    EMPTY, FEN_LETTERS, FEN_PIECES, FILES, KING, PAWN, START_FEN, TYPE_MASK, Position,
+    parse_square, square_name, square_pos,
+)
+
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_RE = re.compile(r'\{[^}]*\}?|\$\d+|[()]|1-0|0-1|1/2-1/2|\*|\d+\.(?:\.\.)?|[^\s(){};$]+')
+SAN_RE = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBNqrbn]))?$')
+
+
+class PGNError(ValueError):
+    """Raised for movetext that does not describe a legal move."""
+
+
+class Game:
+    def __init__(self, headers=None, moves=None, result='*', error=None):
+        """A game record: tag pairs, (start, end, promotion) moves and the result."""
+        self.headers = dict(headers or {})
+        self.moves = list(moves or [])
+        self.result = result
+        self.error = error
+
+    @classmethod
+    def from_position(cls, position, headers=None):
+        """Build a game from the moves played on a Position."""
+        position = position.copy()
+        if position.promoting_pawn:
+            position.unmake_move()
+        moves = [record[0] for record in position.history]
+        result = game_result(position)
+        while position.history:
+            position.unmake_move()
+
+        headers = dict(headers or {})
+        start_fen = position.to_fen()
+        if start_fen != START_FEN:
+            headers.setdefault('SetUp', '1')
+            headers.setdefault('FEN', start_fen)
+        headers['Result'] = result
+        return cls(headers, moves, result)
+
+    def start_position(self):
+        """Return the position the game starts from."""
+        return Position.from_fen(self.headers.get('FEN', START_FEN))
+
+    def end_position(self):
+        """Return the position after the last move."""
+        position = self.start_position()
+        for move in self.moves:
+            position.make_move(move)
+        position.update_game_state()
+        return position
+
+
+def game_result(position):
+    """Return the PGN result string of a Position."""
+    if not position.game_over:
+        return '*'
+    if position.winner == 'Brancas':
+        return '1-0'
+    if position.winner == 'Pretas':
+        return '0-1'
+    return '1/2-1/2'
+
+
+def move_to_san(position, move):
+    """Return the standard algebraic notation of a legal move in position."""
+    start, end, promotion = move
+    board = position.board
+    piece = board[start]
+    kind = piece & TYPE_MASK
+
+    if kind == KING and abs(end - start) == 2:
+        san = 'O-O' if end > start else 'O-O-O'
+    elif kind == PAWN:
+        san = square_name(end)
+        if position._captured_square(move):
+            san = FILES[square_pos(start)[1]] + 'x' + san
+        if promotion:
+            san += '=' + FEN_LETTERS[promotion]
+    else:
+        rivals = {other for other, target, _ in position.legal_moves()
+                  if target == end and other != start and board[other] == piece}
+        prefix = ''
+        if rivals:
+            row, col = square_pos(start)
+            if all(square_pos(other)[1] != col for other in rivals):
+                prefix = FILES[col]
+            elif all(square_pos(other)[0] != row for other in rivals):
+                prefix = square_name(start)[1]
+            else:
+                prefix = square_name(start)
+        capture = 'x' if board[end] != EMPTY else ''
+        san = FEN_LETTERS[kind] + prefix + capture + square_name(end)
+
+    position.make_move(move)
+    if position.is_king_in_check(position.turn):
+        san += '#' if not position.generate_moves() else '+'
+    position.unmake_move()
+    return san
+
+
+def parse_san(position, text):
+    """Return the legal (start, end, promotion) move written as text in SAN."""
+    san = text.rstrip('+#!?')
+    moves = position.legal_moves()
+    board = position.board
+
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        long_castle = len(san) == 5
+        for move in moves:
+            start, end, _ = move
+            if board[start] & TYPE_MASK == KING and end - start == (-2 if long_castle else 2):
+                return move
+        raise PGNError(f"Illegal castling '{text}'")
+
+    match = SAN_RE.match(san)
+    if not match:
+        raise PGNError(f"Unreadable move '{text}'")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    kind = FEN_PIECES[letter] if letter else PAWN
+    end = parse_square(target)
+    promotion = FEN_PIECES[promotion.upper()] if promotion else EMPTY
+
+    candidates = []
+    for move in moves:
+        start, move_end, move_promotion = move
+        if move_end != end or board[start] & TYPE_MASK != kind or move_promotion != promotion:
+            continue
+        name = square_name(start)
+        if (from_file and name[0] != from_file) or (from_rank and name[1] != from_rank):
+            continue
+        candidates.append(move)
+
+    if not candidates:
+        raise PGNError(f"Illegal move '{text}'")
+    if len(candidates) > 1:
+        raise PGNError(f"Ambiguous move '{text}'")
+    return candidates[0]
+
+
+def open_pgn(path):
+    """Open a PGN file for reading text, decompressing .gz and .bz2 on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def read_games(stream, parse_moves=True):
+    """Yield a Game for every game in a text stream of PGN.
+
+    Moves are checked against the legal move generator; a game whose
+    movetext goes wrong keeps the moves before the problem and carries
+    the message in Game.error. With parse_moves=False only the tag pairs
+    and result are read, which is much faster for filtering.
+    """
+    headers = {}
+    movetext = []
+    in_comment = False
+    for line in stream:
+        stripped = line.strip()
+        if stripped.startswith('%'):
+            continue
+        if stripped.startswith('[') and not in_comment:
+            if movetext:
+                yield _build_game(headers, movetext, parse_moves)
+                headers = {}
+                movetext = []
+            match = HEADER_RE.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+        # Track brace comments across lines: a '[' inside one is not a tag pair,
+        # and a ';' outside one comments out the rest of the line
+        for index, char in enumerate(stripped if in_comment or '{' in stripped or ';' in stripped else ''):
+            if char == '{':
+                in_comment = True
+            elif char == '}':
+                in_comment = False
+            elif char == ';' and not in_comment:
+                stripped = stripped[:index]
+                break
+        if stripped:
+            movetext.append(stripped)
+    if headers or movetext:
+        yield _build_game(headers, movetext, parse_moves)
+
+
+def _build_game(headers, movetext, parse_moves):
+    """Turn collected tag pairs and movetext lines into a Game."""
+    game = Game(headers, result=headers.get('Result', '*'))
+    position = game.start_position() if parse_moves else None
+    variation_depth = 0
+    for token in TOKEN_RE.findall(' '.join(movetext)):
+        first = token[0]
+        if first in '{$' or first.isdigit() and token.endswith('.'):
+            continue
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth:
+            continue
+        elif token in RESULTS:
+            game.result = token
+        elif parse_moves and game.error is None:
+            try:
+                move = parse_san(position, token)
+            except PGNError as error:
+                game.error = f'{error} at ply {len(game.moves) + 1}'
+                continue
+            position.make_move(move)
+            game.moves.append(move)
+    return game
+
+
+def game_to_pgn(game, width=79):
+    """Return the PGN text of a game."""
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+    lines = []
+    for tag in SEVEN_TAG_ROSTER:
+        lines.append(f'[{tag} "{_escape(headers.pop(tag, "?"))}"]')
+    for tag, value in headers.items():
+        lines.append(f'[{tag} "{_escape(value)}"]')
+    lines.append('')
+
+    position = game.start_position()
+    words = []
+    for index, move in enumerate(game.moves):
+        if position.turn == 'b':
+            words.append(f'{position.fullmove_number}.')
+        elif index == 0:
+            words.append(f'{position.fullmove_number}...')
+        words.append(move_to_san(position, move))
+        position.make_move(move)
+    words.append(game.result)
+
+    line = ''
+    for word in words:
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def write_game(game, out):
+    """Write a game as PGN to a text stream, followed by a blank line."""
+    out.write(game_to_pgn(game))
+    out.write('\n')
+
+
+def _escape(value):
+    """Escape a tag value for PGN."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
@@ -0,0 +1,137 @@
+"""Headless replay of game records through the rules engine, sharded across processes.
+
+Each input line is one game in coordinate notation ('e2e4 e7e5 g1f3 ...').
+Every move goes through the same legality check the board uses, and one
+JSON line per game reports where it ended: its FEN, Zobrist hash, result,
+or the first illegal move. Input is read in chunks and only a bounded
+number of chunks is in flight, so files of any size stream through in
+constant memory.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from pgn import game_result, open_pgn
+from rules import START_FEN, Position, parse_move
+
+
+def replay_game(text, fen=START_FEN):
+    """Replay one line of coordinate moves and return a result dict."""
+    position = Position.from_fen(fen)
+    tokens = text.split()
+    error = None
+    for ply, token in enumerate(tokens, start=1):
+        try:
+            move = parse_move(token)
+        except ValueError as exc:
+            error = f'{exc} at ply {ply}'
+            break
+        if not position.play_move(move):
+            reason = 'game already over' if position.game_over else 'illegal move'
+            error = f"{reason} '{token}' at ply {ply}"
+            break
+
+    return {
+        'moves': len(position.history),
+        'fen': position.to_fen(),
+        'hash': f'{position.hash:016x}',
+        'result': game_result(position),
+        'end_reason': position.end_reason,
+        'error': error,
+    }
+
+
+def replay_lines(first_line, lines, fen=START_FEN):
+    """Yield a result dict, tagged with its line number, for every game in lines."""
+    for line_number, line in enumerate(lines, start=first_line):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield {'line': line_number, **replay_game(line, fen)}
+
+
+def _replay_chunk(first_line, lines, fen):
+    """Replay a chunk of input lines in a worker process."""
+    return list(replay_lines(first_line, lines, fen))
+
+
+def read_chunks(stream, chunk_lines):
+    """Yield (first line number, lines) chunks of a text stream."""
+    line_number = 1
+    while True:
+        lines = list(islice(stream, chunk_lines))
+        if not lines:
+            return
+        yield line_number, lines
+        line_number += len(lines)
+
+
+def replay_stream(stream, workers=None, chunk_lines=500, fen=START_FEN):
+    """Yield a result dict for every game in stream, in input order.
+
+    At most two chunks per worker are queued at a time, which bounds memory
+    use however long the input is. With one worker everything runs in this
+    process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from replay_lines(1, stream, fen)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for first_line, lines in read_chunks(stream, chunk_lines):
+            pending.append(executor.submit(_replay_chunk, first_line, lines, fen))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay coordinate-notation games through the rules engine.')
+    parser.add_argument('input', help="file with one game per line ('-' for stdin, .gz/.bz2 allowed)")
+    parser.add_argument('--output', '-o', default='-', help="JSON lines output ('-' for stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--chunk-lines', type=int, default=500, help='games sent to a worker at a time')
+    parser.add_argument('--fen', default=START_FEN, help='position every game starts from')
+    parser.add_argument('--errors-only', action='store_true', help='only write games with an illegal move')
+    parser.add_argument('--progress', type=int, default=10000, metavar='GAMES',
+                        help='report progress on stderr every GAMES games (0 to disable)')
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin if args.input == '-' else open_pgn(args.input)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    games = errors = moves = 0
+    start = time.perf_counter()
+    try:
+        for result in replay_stream(stream, args.workers, args.chunk_lines, args.fen):
+            games += 1
+            moves += result['moves']
+            if result['error']:
+                errors += 1
+            if result['error'] or not args.errors_only:
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            if args.progress and games % args.progress == 0:
+                elapsed = time.perf_counter() - start
+                print(f'{games} games, {errors} with errors, {games / elapsed:,.0f} games/s',
+                      file=sys.stderr)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    print(f'{games} games, {moves} moves, {errors} with errors in {elapsed:.2f}s '
+          f'({games / max(elapsed, 1e-9):,.0f} games/s, {moves / max(elapsed, 1e-9):,.0f} moves/s)',
+          file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,892 @@
+"""Headless chess rules: board state and move generation, no pygame required."""
+import random
+from collections import OrderedDict
+
+BOARD_SIZE = 8
+
+# Piece codes stored in the board buffer: piece type in the low bits plus a colour bit
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+WHITE, BLACK = 0, 8
+TYPE_MASK = 7
+COLOR_MASK = 8
+OFFBOARD = 0xFF
+
+COLORS = {'b': WHITE, 'p': BLACK}
+COLOR_NAMES = {WHITE: 'b', BLACK: 'p'}
+PIECE_LETTERS = ' PCBTDR'
+PIECE_NAMES = [''] * 16
+for _kind in range(PAWN, KING + 1):
+    for _color in (WHITE, BLACK):
+        PIECE_NAMES[_kind | _color] = PIECE_LETTERS[_kind] + COLOR_NAMES[_color]
+PIECE_CODES = {name: code for code, name in enumerate(PIECE_NAMES) if name}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+FEN_PIECES = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+FEN_LETTERS = {kind: letter for letter, kind in FEN_PIECES.items()}
+FILES = 'abcdefgh'
+
+# 10x12 mailbox: two sentinel rows above and below, one sentinel column on each side
+def square(pos):
+    """Return the mailbox index of a (row, col) board position."""
+    row, col = pos
+    return 21 + row * 10 + col
+
+
+def square_pos(sq):
+    """Return the (row, col) board position of a mailbox index."""
+    return divmod(sq - 21, 10)
+
+
+def square_name(sq):
+    """Return the algebraic name ('e4') of a mailbox index."""
+    row, col = square_pos(sq)
+    return FILES[col] + str(BOARD_SIZE - row)
+
+
+def parse_square(name):
+    """Return the mailbox index of an algebraic square name."""
+    return square((BOARD_SIZE - int(name[1]), FILES.index(name[0])))
+
+
+def move_name(move):
+    """Return a (start, end, promotion) move in coordinate notation, e.g. 'e7e8q'."""
+    start, end, promotion = move
+    suffix = FEN_LETTERS[promotion].lower() if promotion else ''
+    return square_name(start) + square_name(end) + suffix
+
+
+def parse_move(name):
+    """Return the (start, end, promotion) move written in coordinate notation, e.g. 'e7e8q'."""
+    if len(name) not in (4, 5) or name[0] not in FILES or name[2] not in FILES \
+            or name[1] not in '12345678' or name[3] not in '12345678':
+        raise ValueError(f"Invalid move '{name}'")
+    promotion = EMPTY
+    if len(name) == 5:
+        promotion = FEN_PIECES.get(name[4].upper())
+        if promotion not in PROMOTION_PIECES:
+            raise ValueError(f"Invalid promotion in '{name}'")
+    return parse_square(name[:2]), parse_square(name[2:4]), promotion
+
+
+SQUARES = [square((row, col)) for row in range(BOARD_SIZE) for col in range(BOARD_SIZE)]
+
+KNIGHT_OFFSETS = (-21, -19, -12, -8, 8, 12, 19, 21)
+BISHOP_OFFSETS = (-11, -9, 9, 11)
+ROOK_OFFSETS = (-10, -1, 1, 10)
+KING_OFFSETS = ROOK_OFFSETS + BISHOP_OFFSETS
+PIECE_OFFSETS = {
+    KNIGHT: KNIGHT_OFFSETS,
+    BISHOP: BISHOP_OFFSETS,
+    ROOK: ROOK_OFFSETS,
+    QUEEN: KING_OFFSETS,
+    KING: KING_OFFSETS,
+}
+SLIDERS = (BISHOP, ROOK, QUEEN)
+PROMOTION_PIECES = (QUEEN, ROOK, BISHOP, KNIGHT)
+RAY_ATTACKERS = [(offset, ROOK) for offset in ROOK_OFFSETS] + [(offset, BISHOP) for offset in BISHOP_OFFSETS]
+
+# Castling rights bits and, per side, (right, king start, king end, rook start, squares that
+# must be empty, squares the king crosses that must not be attacked)
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_LETTERS = 'KQkq'
+CASTLING_MOVES = {
+    WHITE: [(WHITE_KINGSIDE, 95, 97, 98, (96, 97), (96, 97)),
+            (WHITE_QUEENSIDE, 95, 93, 91, (94, 93, 92), (94, 93))],
+    BLACK: [(BLACK_KINGSIDE, 25, 27, 28, (26, 27), (26, 27)),
+            (BLACK_QUEENSIDE, 25, 23, 21, (24, 23, 22), (24, 23))],
+}
+# Rights kept when a move starts or ends on each square
+CASTLING_MASKS = [0xF] * 120
+CASTLING_MASKS[95] = 0xF & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASKS[98] = 0xF & ~WHITE_KINGSIDE
+CASTLING_MASKS[91] = 0xF & ~WHITE_QUEENSIDE
+CASTLING_MASKS[25] = 0xF & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASKS[28] = 0xF & ~BLACK_KINGSIDE
+CASTLING_MASKS[21] = 0xF & ~BLACK_QUEENSIDE
+
+# Zobrist keys: one 64-bit number per (piece code, square), castling rights value,
+# en passant square and black to move, generated from a fixed seed so hashes are stable
+_zobrist_random = random.Random(0x5A0B)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) if PIECE_NAMES[code] else 0 for _ in range(120)]
+                  for code in range(16)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for _ in range(120)]
+ZOBRIST_EP[0] = 0
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# Reasons shown when a game ends
+CHECKMATE = 'Xeque-mate'
+STALEMATE = 'Afogamento'
+THREEFOLD_REPETITION = 'Tripla repetição'
+FIFTY_MOVE_RULE = 'Regra dos 50 lances'
+INSUFFICIENT_MATERIAL = 'Material insuficiente'
+
+# Positions whose moves are remembered by each game's MoveCache: enough for take-backs and
+# repetitions, and the cache is emptied after every capture or pawn move anyway
+MOVE_CACHE_SIZE = 16
+
+START_ROWS = [
+    ['Tp', 'Cp', 'Bp', 'Dp', 'Rp', 'Bp', 'Cp', 'Tp'],
+    ['Pp'] * 8,
+    [''] * 8,
+    [''] * 8,
+    [''] * 8,
+    [''] * 8,
+    ['Pb'] * 8,
+    ['Tb', 'Cb', 'Bb', 'Db', 'Rb', 'Bb', 'Cb', 'Tb']
+]
+
+
+def generate_legal_moves(position, color=None):
+    """Return every legal (start, end, promotion) move for color, the side to move by default.
+
+    Checkers and pinned pieces are found once by walking out from the king,
+    so each pseudo-legal move is accepted or rejected with a set lookup
+    instead of playing it and testing for check.
+    """
+    board = position.board
+    color = position.turn if color is None else color
+    own = COLORS[color]
+    enemy = own ^ COLOR_MASK
+    king_sq = position.king_positions[color]
+
+    checkers = 0
+    evasion = None
+    pins = {}
+
+    pawn = PAWN | enemy
+    step = -10 if own == WHITE else 10
+    for sq in (king_sq + step - 1, king_sq + step + 1):
+        if board[sq] == pawn:
+            checkers += 1
+            evasion = {sq}
+    knight = KNIGHT | enemy
+    for offset in KNIGHT_OFFSETS:
+        if board[king_sq + offset] == knight:
+            checkers += 1
+            evasion = {king_sq + offset}
+
+    queen = QUEEN | enemy
+    for offset, slider in RAY_ATTACKERS:
+        ray = []
+        pinned = None
+        to = king_sq + offset
+        while True:
+            target = board[to]
+            if target == EMPTY:
+                ray.append(to)
+            elif target == OFFBOARD:
+                break
+            elif target & COLOR_MASK == own:
+                if pinned is not None:
+                    break
+                pinned = to
+            else:
+                if target == queen or target == slider | enemy:
+                    ray.append(to)
+                    if pinned is None:
+                        checkers += 1
+                        evasion = set(ray)
+                    else:
+                        pins[pinned] = set(ray)
+                break
+            to += offset
+
+    moves = []
+    if checkers == 0 and position.castling and color == position.turn:
+        for right, king_start, king_end, rook_start, empty, safe in CASTLING_MOVES[own]:
+            if (position.castling & right and king_sq == king_start
+                    and board[rook_start] == ROOK | own
+                    and all(board[sq] == EMPTY for sq in empty)
+                    and not any(position._is_attacked(sq, enemy) for sq in safe)):
+                moves.append((king_sq, king_end, EMPTY))
+
+    board[king_sq] = EMPTY
+    for offset in KING_OFFSETS:
+        to = king_sq + offset
+        target = board[to]
+        if (target == EMPTY or (target != OFFBOARD and target & COLOR_MASK == enemy)) \
+                and not position._is_attacked(to, enemy):
+            moves.append((king_sq, to, EMPTY))
+    board[king_sq] = KING | own
+
+    if checkers > 1:
+        return moves
+
+    ep_square = position.ep_square
+    if ep_square and color == position.turn:
+        # Rare enough to test by playing it; this also covers the pawn pair leaving a rank pin
+        for sq in (ep_square - step - 1, ep_square - step + 1):
+            if board[sq] == PAWN | own:
+                position.make_move((sq, ep_square, EMPTY))
+                if not position._is_attacked(king_sq, enemy):
+                    moves.append((sq, ep_square, EMPTY))
+                position.unmake_move()
+
+    last_row = 0 if own == WHITE else BOARD_SIZE - 1
+    for sq in SQUARES:
+        piece = board[sq]
+        if piece == EMPTY or piece & COLOR_MASK != own or sq == king_sq:
+            continue
+        allowed = pins.get(sq)
+        if evasion is not None:
+            allowed = evasion if allowed is None else allowed & evasion
+        promotes = piece & TYPE_MASK == PAWN and (sq - 21) // 10 == last_row - step // 10
+        for to in position._basic_moves(sq):
+            if allowed is not None and to not in allowed:
+                continue
+            if promotes:
+                for promotion in PROMOTION_PIECES:
+                    moves.append((sq, to, promotion))
+            else:
+                moves.append((sq, to, EMPTY))
+    return moves
+
+
+class MoveInfo:
+    """What the interface asks about one position, computed once: legal moves, their targets and captures."""
+
+    __slots__ = ('moves', 'in_check', 'targets', 'captures')
+
+    def __init__(self, moves, in_check):
+        self.moves = moves
+        self.in_check = in_check
+        # {start square: [(row, col) targets]} and {start square: {(row, col) captured}}, built on first use
+        self.targets = None
+        self.captures = None
+
+
+class MoveCache:
+    """Least recently used map from position fingerprints to MoveInfo."""
+
+    def __init__(self, capacity=MOVE_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        info = self.entries.get(key)
+        if info is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return info
+
+    def put(self, key, info):
+        self.entries[key] = info
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def _parse_ep_square(board, turn, name, fen):
+    """Return the en passant square of a FEN field, or 0 when no pawn can take there (as make_move does)."""
+    rank = '6' if turn == 'b' else '3'
+    if len(name) != 2 or name[0] not in FILES or name[1] != rank:
+        raise ValueError(f"Invalid FEN '{fen}': bad en passant square '{name}'")
+    ep_square = parse_square(name)
+    own = COLORS[turn]
+    enemy_pawn = PAWN | (own ^ COLOR_MASK)
+    pushed = ep_square + 10 if own == WHITE else ep_square - 10
+    origin = ep_square - 10 if own == WHITE else ep_square + 10
+    if board[pushed] != enemy_pawn or board[ep_square] != EMPTY or board[origin] != EMPTY:
+        raise ValueError(f"Invalid FEN '{fen}': no pawn just moved through '{name}'")
+    if board[pushed - 1] == PAWN | own or board[pushed + 1] == PAWN | own:
+        return ep_square
+    return 0
+
+
+class Position:
+    def __init__(self):
+        """Initialize a position with the standard starting setup."""
+        self.turn = 'b'
+        self.check = {'b': False, 'p': False}
+        self.game_over = False
+        self.winner = None
+        self.promoting_pawn = None
+        self.history = []
+        self._move_info = None
+        self.move_cache = MoveCache()
+        self.end_reason = None
+        self.init_board()
+
+    def init_board(self):
+        """Initialize the chess board with starting positions."""
+        self.board = bytearray([OFFBOARD]) * 120
+        self.king_positions = {}
+        for row, names in enumerate(START_ROWS):
+            for col, name in enumerate(names):
+                sq = square((row, col))
+                self.board[sq] = PIECE_CODES[name] if name else EMPTY
+                if name and name[0] == 'R':
+                    self.king_positions[name[1]] = sq
+        self.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.ep_square = 0
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.reset_repetitions()
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Return a new position set up from a FEN string."""
+        position = cls()
+        position.load_fen(fen)
+        return position
+
+    def load_fen(self, fen):
+        """Replace the current position with the one described by a FEN string.
+
+        The halfmove clock and move number fields are optional. Every field is
+        checked before anything is assigned, so a ValueError leaves the
+        position as it was.
+        """
+        fields = fen.split()
+        if not fields or len(fields) > 6:
+            raise ValueError(f"Invalid FEN '{fen}': expected 1 to 6 fields")
+        rows = fields[0].split('/')
+        if len(rows) != BOARD_SIZE:
+            raise ValueError(f"Invalid FEN '{fen}': expected {BOARD_SIZE} ranks")
+
+        board = bytearray([OFFBOARD]) * 120
+        king_positions = {}
+        kings = 0
+        for row, text in enumerate(rows):
+            col = 0
+            for char in text:
+                if char in '12345678' and col + int(char) <= BOARD_SIZE:
+                    for _ in range(int(char)):
+                        board[square((row, col))] = EMPTY
+                        col += 1
+                    continue
+                if char.upper() not in FEN_PIECES or col >= BOARD_SIZE:
+                    raise ValueError(f"Invalid FEN '{fen}': bad rank '{text}'")
+                color = WHITE if char.isupper() else BLACK
+                kind = FEN_PIECES[char.upper()]
+                if kind == PAWN and row in (0, BOARD_SIZE - 1):
+                    raise ValueError(f"Invalid FEN '{fen}': pawn on the first or last rank")
+                sq = square((row, col))
+                board[sq] = kind | color
+                if kind == KING:
+                    king_positions[COLOR_NAMES[color]] = sq
+                    kings += 1
+                col += 1
+            if col != BOARD_SIZE:
+                raise ValueError(f"Invalid FEN '{fen}': bad rank '{text}'")
+        if kings != 2 or len(king_positions) != 2:
+            raise ValueError(f"Invalid FEN '{fen}': each side needs one king")
+
+        side = fields[1] if len(fields) > 1 else 'w'
+        if side not in ('w', 'b'):
+            raise ValueError(f"Invalid FEN '{fen}': bad side to move '{side}'")
+        turn = 'p' if side == 'b' else 'b'
+        waiting = 'p' if turn == 'b' else 'b'
+        # Probe a bare Position holding only the new board: self must not change yet,
+        # and subclasses may keep their own state that is only synced afterwards
+        probe = Position.__new__(Position)
+        probe.board = board
+        if Position._is_attacked(probe, king_positions[waiting], COLORS[turn]):
+            raise ValueError(f"Invalid FEN '{fen}': the side not to move is in check")
+
+        castling = 0
+        if len(fields) > 2 and fields[2] != '-':
+            for char in fields[2]:
+                if char not in CASTLING_LETTERS:
+                    raise ValueError(f"Invalid FEN '{fen}': bad castling field '{fields[2]}'")
+                castling |= 1 << CASTLING_LETTERS.index(char)
+
+        ep_square = 0
+        if len(fields) > 3 and fields[3] != '-':
+            ep_square = _parse_ep_square(board, turn, fields[3], fen)
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN '{fen}': bad move counters") from None
+        if halfmove_clock < 0 or fullmove_number < 1:
+            raise ValueError(f"Invalid FEN '{fen}': bad move counters")
+
+        self.board = board
+        self.king_positions = king_positions
+        self.turn = turn
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.reset_game_state()
+
+    def reset_game_state(self, update_state=True):
+        """Start a fresh game from the board and state fields as they are now set.
+
+        update_state=False leaves check, mate and draw detection for later,
+        which bulk readers that never ask for them can skip.
+        """
+        self.history = []
+        self.reset_repetitions()
+        self._move_info = None
+        self.move_cache = MoveCache()
+        self.promoting_pawn = None
+        self.game_over = False
+        self.winner = None
+        self.end_reason = None
+        if update_state:
+            self.update_game_state()
+
+    def to_fen(self):
+        """Return the position as a FEN string."""
+        rows = []
+        for row in range(BOARD_SIZE):
+            text = ''
+            empty = 0
+            for col in range(BOARD_SIZE):
+                piece = self.board[square((row, col))]
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[piece & TYPE_MASK]
+                text += letter if piece & COLOR_MASK == WHITE else letter.lower()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+
+        castling = ''.join(letter for index, letter in enumerate(CASTLING_LETTERS)
+                           if self.castling & 1 << index) or '-'
+        ep_square = square_name(self.ep_square) if self.ep_square else '-'
+        side = 'w' if self.turn == 'b' else 'b'
+        return f"{'/'.join(rows)} {side} {castling} {ep_square} {self.halfmove_clock} {self.fullmove_number}"
+
+    def reset_repetitions(self):
+        """Start repetition counting from the current position."""
+        self.hash = self.compute_hash()
+        self.repetitions = {self.hash: 1}
+
+    def compute_hash(self):
+        """Return the Zobrist hash of the position computed from scratch."""
+        board = self.board
+        value = ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_EP[self.ep_square]
+        if self.turn == 'p':
+            value ^= ZOBRIST_BLACK_TO_MOVE
+        for sq in SQUARES:
+            value ^= ZOBRIST_PIECES[board[sq]][sq]
+        return value
+
+    def copy(self):
+        """Return an independent copy of this position."""
+        other = type(self).__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.board = self.board[:]
+        other.check = self.check.copy()
+        other.king_positions = self.king_positions.copy()
+        other.history = self.history[:]
+        other.repetitions = self.repetitions.copy()
+        other._move_info = None
+        other.move_cache = MoveCache()
+        return other
+
+    def __getstate__(self):
+        """Pickle without the move cache; it is rebuilt on demand."""
+        state = self.__dict__.copy()
+        state.pop('_move_info', None)
+        state.pop('move_cache', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._move_info = None
+        self.move_cache = MoveCache()
+
+    def make_move(self, move):
+        """Play a (start, end, promotion) move and push its undo record."""
+        start, end, promotion = move
+        board = self.board
+        piece = board[start]
+        kind = piece & TYPE_MASK
+        color = piece & COLOR_MASK
+        captured = board[end]
+        self.history.append((move, piece, captured, self.castling, self.ep_square,
+                             self.halfmove_clock, self.hash))
+        self._move_info = None
+
+        board[start] = EMPTY
+        moved = promotion | color if promotion else piece
+        board[end] = moved
+        value = (self.hash ^ ZOBRIST_PIECES[piece][start] ^ ZOBRIST_PIECES[captured][end]
+                 ^ ZOBRIST_PIECES[moved][end] ^ ZOBRIST_EP[self.ep_square] ^ ZOBRIST_BLACK_TO_MOVE)
+        ep_square = 0
+        if kind == PAWN:
+            if end == self.ep_square:
+                taken = end + 10 if color == WHITE else end - 10
+                value ^= ZOBRIST_PIECES[board[taken]][taken]
+                board[taken] = EMPTY
+            elif end - start in (20, -20):
+                # Only record the square when a pawn can actually take en passant
+                enemy_pawn = PAWN | (color ^ COLOR_MASK)
+                if board[end - 1] == enemy_pawn or board[end + 1] == enemy_pawn:
+                    ep_square = (start + end) // 2
+        elif kind == KING:
+            self.king_positions[COLOR_NAMES[color]] = end
+            if end - start == 2:
+                board[start + 1] = board[start + 3]
+                board[start + 3] = EMPTY
+                value ^= ZOBRIST_PIECES[ROOK | color][start + 3] ^ ZOBRIST_PIECES[ROOK | color][start + 1]
+            elif start - end == 2:
+                board[start - 1] = board[start - 4]
+                board[start - 4] = EMPTY
+                value ^= ZOBRIST_PIECES[ROOK | color][start - 4] ^ ZOBRIST_PIECES[ROOK | color][start - 1]
+
+        castling = self.castling & CASTLING_MASKS[start] & CASTLING_MASKS[end]
+        value ^= ZOBRIST_CASTLING[self.castling] ^ ZOBRIST_CASTLING[castling] ^ ZOBRIST_EP[ep_square]
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = 0 if kind == PAWN or captured else self.halfmove_clock + 1
+        if color == BLACK:
+            self.fullmove_number += 1
+        self.turn = 'p' if self.turn == 'b' else 'b'
+
+        self.hash = value
+        self.repetitions[value] = self.repetitions.get(value, 0) + 1
+
+    def unmake_move(self):
+        """Take back the last move played with make_move and return it."""
+        move, piece, captured, self.castling, ep_square, self.halfmove_clock, old_hash = self.history.pop()
+        start, end, _ = move
+        self._move_info = None
+
+        count = self.repetitions[self.hash] - 1
+        if count:
+            self.repetitions[self.hash] = count
+        else:
+            del self.repetitions[self.hash]
+        self.hash = old_hash
+
+        board = self.board
+        board[start] = piece
+        board[end] = captured
+        kind = piece & TYPE_MASK
+        color = piece & COLOR_MASK
+        if kind == PAWN:
+            if end == ep_square:
+                board[end + 10 if color == WHITE else end - 10] = PAWN | (color ^ COLOR_MASK)
+        elif kind == KING:
+            self.king_positions[COLOR_NAMES[color]] = start
+            if end - start == 2:
+                board[start + 3] = board[start + 1]
+                board[start + 1] = EMPTY
+            elif start - end == 2:
+                board[start - 4] = board[start - 1]
+                board[start - 1] = EMPTY
+
+        self.ep_square = ep_square
+        if color == BLACK:
+            self.fullmove_number -= 1
+        self.turn = 'p' if self.turn == 'b' else 'b'
+        return move
+
+    def generate_moves(self, color=None):
+        """Return every legal move for color, the side to move by default, without caching."""
+        return generate_legal_moves(self, color)
+
+    def fingerprint(self):
+        """Return a key that identifies the position for move generation."""
+        return self.hash, bytes(self.board)
+
+    def move_info(self):
+        """Return the MoveInfo of the position, from the move cache when it was seen before."""
+        info = self._move_info
+        if info is None:
+            key = self.fingerprint()
+            info = self.move_cache.get(key)
+            if info is None:
+                if self.halfmove_clock == 0:
+                    # After a capture or pawn move no earlier position can come back
+                    self.move_cache.clear()
+                in_check = self.is_king_in_check(self.turn)
+                info = MoveInfo(self.generate_moves(), in_check)
+                self.move_cache.put(key, info)
+            self._move_info = info
+        return info
+
+    def legal_moves(self):
+        """Return the legal moves of the side to move, generated once per position."""
+        return self.move_info().moves
+
+    def _move_targets(self):
+        """Return {start square: [(row, col) targets]} of the legal moves."""
+        info = self.move_info()
+        if info.targets is None:
+            targets = {}
+            for start, end, _ in info.moves:
+                ends = targets.setdefault(start, [])
+                if square_pos(end) not in ends:
+                    ends.append(square_pos(end))
+            info.targets = targets
+        return info.targets
+
+    def _capture_targets(self):
+        """Return {start square: {(row, col) of captured pieces}} of the legal moves."""
+        info = self.move_info()
+        if info.captures is None:
+            captures = {}
+            for move in info.moves:
+                target = self._captured_square(move)
+                if target:
+                    captures.setdefault(move[0], set()).add(square_pos(target))
+            info.captures = captures
+        return info.captures
+
+    def piece_at(self, pos):
+        """Return the piece code at pos, or '' for an empty square."""
+        return PIECE_NAMES[self.board[square(pos)]]
+
+    def is_valid_move(self, start_pos, end_pos):
+        """Check if a move is valid."""
+        start = square(start_pos)
+        end = square(end_pos)
+        for move in self.legal_moves():
+            if move[0] == start and move[1] == end:
+                return True
+        return False
+
+    def is_king_in_check(self, color):
+        """Check if the king of the given color is in check."""
+        return self._is_attacked(self.king_positions[color], COLORS[color] ^ COLOR_MASK)
+
+    def is_square_attacked(self, pos, by_color):
+        """Check if any piece of by_color attacks the (row, col) square pos."""
+        return self._is_attacked(square(pos), COLORS[by_color])
+
+    def _is_attacked(self, sq, by):
+        """Probe outward from mailbox square sq for attackers of colour bit by."""
+        board = self.board
+
+        pawn = PAWN | by
+        if by == WHITE:
+            if board[sq + 9] == pawn or board[sq + 11] == pawn:
+                return True
+        elif board[sq - 9] == pawn or board[sq - 11] == pawn:
+            return True
+
+        knight = KNIGHT | by
+        for offset in KNIGHT_OFFSETS:
+            if board[sq + offset] == knight:
+                return True
+
+        king = KING | by
+        for offset in KING_OFFSETS:
+            if board[sq + offset] == king:
+                return True
+
+        queen = QUEEN | by
+        for offset, slider in RAY_ATTACKERS:
+            to = sq + offset
+            target = board[to]
+            while target == EMPTY:
+                to += offset
+                target = board[to]
+            if target == queen or target == slider | by:
+                return True
+        return False
+
+    def play_move(self, move):
+        """Play a complete (start, end, promotion) move if it is legal and update the game state."""
+        if self.game_over or self.promoting_pawn or move not in self.legal_moves():
+            return False
+        self.make_move(move)
+        self.update_game_state()
+        return True
+
+    def move_piece(self, start_pos, end_pos):
+        """Move a piece from start_pos to end_pos if the move is valid."""
+        if self.game_over or self.promoting_pawn or not self.is_valid_move(start_pos, end_pos):
+            return False
+
+        start = square(start_pos)
+        piece = self.board[start]
+        self.make_move((start, square(end_pos), EMPTY))
+
+        if piece & TYPE_MASK == PAWN and end_pos[0] in (0, BOARD_SIZE - 1):
+            self.promoting_pawn = tuple(end_pos)
+        else:
+            self.update_game_state()
+
+        return True
+
+    def update_game_state(self):
+        """Refresh check flags and detect mate or a draw for the side to move."""
+        other = 'p' if self.turn == 'b' else 'b'
+        self.check[self.turn] = self.move_info().in_check
+        self.check[other] = self.is_king_in_check(other)
+
+        if self.check[self.turn] and self.is_checkmate(self.turn):
+            self.game_over = True
+            self.winner = 'Pretas' if self.turn == 'b' else 'Brancas'
+            self.end_reason = CHECKMATE
+            return
+
+        reason = STALEMATE if not self.legal_moves() else self.draw_reason()
+        if reason:
+            self.game_over = True
+            self.winner = None
+            self.end_reason = reason
+
+    def draw_reason(self):
+        """Return why the position is drawn by rule, or None."""
+        if self.halfmove_clock >= 100:
+            return FIFTY_MOVE_RULE
+        if self.repetitions[self.hash] >= 3:
+            return THREEFOLD_REPETITION
+        if self.has_insufficient_material():
+            return INSUFFICIENT_MATERIAL
+        return None
+
+    def has_insufficient_material(self):
+        """Check if neither side has material left to deliver mate."""
+        board = self.board
+        minors = []
+        for sq in SQUARES:
+            kind = board[sq] & TYPE_MASK
+            if kind in (PAWN, ROOK, QUEEN):
+                return False
+            if kind in (KNIGHT, BISHOP):
+                minors.append((kind, sum(square_pos(sq)) % 2))
+        if len(minors) <= 1:
+            return True
+        return all(kind == BISHOP for kind, _ in minors) and len({shade for _, shade in minors}) == 1
+
+    def get_moves_to_escape_check(self, color):
+        """Return moves that can remove the king from check."""
+        moves = self.legal_moves() if color == self.turn else self.generate_moves(color)
+        return list(dict.fromkeys(square_pos(start) + square_pos(end) for start, end, _ in moves))
+
+    def get_basic_moves(self, pos):
+        """Return basic moves for a piece without considering check."""
+        return [square_pos(to) for to in self._basic_moves(square(pos))]
+
+    def _basic_moves(self, sq):
+        """Return target squares for the piece on mailbox square sq, ignoring check."""
+        board = self.board
+        piece = board[sq]
+        moves = []
+
+        if piece == EMPTY:
+            return moves
+
+        color = piece & COLOR_MASK
+        kind = piece & TYPE_MASK
+
+        if kind == PAWN:
+            step = -10 if color == WHITE else 10
+            to = sq + step
+            if board[to] == EMPTY:
+                moves.append(to)
+                start_row = 6 if color == WHITE else 1
+                if (sq - 21) // 10 == start_row and board[to + step] == EMPTY:
+                    moves.append(to + step)
+            for to in (sq + step - 1, sq + step + 1):
+                target = board[to]
+                if target != EMPTY and target != OFFBOARD and target & COLOR_MASK != color:
+                    moves.append(to)
+
+        elif kind in SLIDERS:
+            for offset in PIECE_OFFSETS[kind]:
+                to = sq + offset
+                target = board[to]
+                while target == EMPTY:
+                    moves.append(to)
+                    to += offset
+                    target = board[to]
+                if target != OFFBOARD and target & COLOR_MASK != color:
+                    moves.append(to)
+
+        else:
+            for offset in PIECE_OFFSETS[kind]:
+                to = sq + offset
+                target = board[to]
+                if target == EMPTY or (target != OFFBOARD and target & COLOR_MASK != color):
+                    moves.append(to)
+
+        return moves
+
+    def would_expose_king(self, start_pos, end_pos):
+        """Check if a move would expose the king to check."""
+        start = square(start_pos)
+        color = COLOR_NAMES[self.board[start] & COLOR_MASK]
+
+        self.make_move((start, square(end_pos), EMPTY))
+        exposed = self.is_king_in_check(color)
+        self.unmake_move()
+
+        return exposed
+
+    def get_possible_moves(self, pos, check_for_check=True):
+        """Return possible moves considering check if check_for_check=True."""
+        sq = square(pos)
+        piece = self.board[sq]
+
+        if check_for_check and piece != EMPTY and piece & COLOR_MASK == COLORS[self.turn]:
+            return list(self._move_targets().get(sq, ()))
+
+        moves = self.get_basic_moves(pos)
+
+        if not check_for_check:
+            return moves
+
+        valid_moves = []
+        for move in moves:
+            if not self.would_expose_king(pos, move):
+                valid_moves.append(move)
+
+        return valid_moves
+
+    def get_capturable_pieces(self, pos):
+        """Return set of positions of pieces that can be captured by the selected piece."""
+        return set(self._capture_targets().get(square(pos), ()))
+
+    def get_all_capturable_pieces(self):
+        """Return the set of pieces the side to move can capture."""
+        return set().union(*self._capture_targets().values())
+
+    def _captured_square(self, move):
+        """Return the square of the piece a move captures, or 0 if it captures nothing."""
+        start, end, _ = move
+        if self.board[end] != EMPTY:
+            return end
+        if end == self.ep_square and self.board[start] & TYPE_MASK == PAWN:
+            return end + 10 if self.turn == 'b' else end - 10
+        return 0
+
+    def is_checkmate(self, color):
+        """Check if the given color is in checkmate."""
+        if color == self.turn:
+            info = self.move_info()
+            return info.in_check and not info.moves
+        if not self.check[color]:
+            return False
+        return not self.get_moves_to_escape_check(color)
+
+    def is_promotion_position(self, pos, piece):
+        """Check if a pawn is in promotion position."""
+        row, _ = pos
+        return (piece[0] == 'P' and
+                ((piece[1] == 'b' and row == 0) or
+                 (piece[1] == 'p' and row == 7)))
+
+    def promote_pawn(self, choice):
+        """Promote a pawn to the chosen piece."""
+        if not self.promoting_pawn:
+            return
+
+        start, end, _ = self.unmake_move()
+        self.make_move((start, end, PIECE_CODES[choice + 'b'] & TYPE_MASK))
+        self.promoting_pawn = None
+        self.update_game_state()
@@ -0,0 +1,258 @@
+"""Network play: an asyncio server holding many games on the headless rules engine.
+
+Clients talk JSON lines over TCP, one object per line. Requests carry an
+"op" and may carry an "id" that is echoed in the reply:
+
+    {"op": "new", "fen": "..."}         start a game and take white
+    {"op": "join", "game": 7}           take the free colour of game 7, or watch it
+    {"op": "move", "game": 7, "move": "e2e4"}
+    {"op": "state", "game": 7}
+    {"op": "leave", "game": 7}
+
+Replies are {"type": "ok", ...} or {"type": "error", "error": "..."}. Moves
+go through Position.move_piece, so they are checked exactly like moves on
+the board. Everyone in a game gets {"type": "update", ...} messages with the
+moves played since the previous one: updates and replies are queued and
+written once per event loop pass, so a burst of moves costs one update per
+game and one write per connection.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from pgn import game_result
+from rules import PIECE_LETTERS, QUEEN, START_FEN, Position, move_name, parse_move, square_pos
+
+# A client whose unsent output grows past this many bytes is too slow to keep up and is dropped
+MAX_BUFFERED = 1 << 20
+
+
+class ServerError(Exception):
+    """A request the server refuses; the message is sent back to the client."""
+
+
+class Game:
+    """One game: its position, who plays each colour and the moves not yet announced."""
+
+    def __init__(self, game_id, fen=START_FEN):
+        self.id = game_id
+        self.position = Position.from_fen(fen)
+        self.players = {'b': None, 'p': None}
+        self.watchers = set()
+        self.unannounced = []
+
+    def connections(self):
+        return {player for player in self.players.values() if player} | self.watchers
+
+    def state(self):
+        """Return the game as a JSON-ready dict."""
+        position = self.position
+        return {
+            'game': self.id,
+            'fen': position.to_fen(),
+            'turn': position.turn,
+            'ply': len(position.history),
+            'check': position.check[position.turn],
+            'game_over': position.game_over,
+            'result': game_result(position),
+            'end_reason': position.end_reason,
+        }
+
+
+class Connection:
+    """One client and the messages waiting to be written to it."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.games = set()
+        self.outbox = []
+
+
+class GameServer:
+    """Holds every game and connection and answers requests; run it with serve()."""
+
+    def __init__(self):
+        self.games = {}
+        self.next_game_id = 1
+        self.dirty_games = set()
+        self.dirty_connections = set()
+        self.flush_scheduled = False
+        self.moves_played = 0
+
+    def send(self, connection, message):
+        """Queue a message for connection, written on the next flush."""
+        connection.outbox.append(json.dumps(message, separators=(',', ':')) + '\n')
+        self.dirty_connections.add(connection)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        """Send one update per game that changed, then write each connection's queue at once."""
+        self.flush_scheduled = False
+        for game in self.dirty_games:
+            update = {'type': 'update', 'moves': game.unannounced, **game.state()}
+            game.unannounced = []
+            for connection in game.connections():
+                connection.outbox.append(json.dumps(update, separators=(',', ':')) + '\n')
+                self.dirty_connections.add(connection)
+        self.dirty_games.clear()
+
+        for connection in self.dirty_connections:
+            transport = connection.writer.transport
+            if transport.is_closing():
+                connection.outbox.clear()
+                continue
+            connection.writer.write(''.join(connection.outbox).encode())
+            connection.outbox.clear()
+            if transport.get_write_buffer_size() > MAX_BUFFERED:
+                transport.abort()
+        self.dirty_connections.clear()
+
+    def game(self, request):
+        game_id = request.get('game')
+        if type(game_id) is not int or game_id not in self.games:
+            raise ServerError('unknown game')
+        return self.games[game_id]
+
+    def op_new(self, connection, request):
+        fen = request.get('fen', START_FEN)
+        if not isinstance(fen, str):
+            raise ServerError('fen must be a string')
+        try:
+            game = Game(self.next_game_id, fen or START_FEN)
+        except ValueError as exc:
+            raise ServerError(f'bad fen: {exc}') from None
+        self.next_game_id += 1
+        self.games[game.id] = game
+        game.players['b'] = connection
+        connection.games.add(game)
+        return {'color': 'b', **game.state()}
+
+    def op_join(self, connection, request):
+        game = self.game(request)
+        free = [color for color, player in game.players.items() if player is None]
+        if free:
+            color = free[0]
+            game.players[color] = connection
+        else:
+            color = None
+            game.watchers.add(connection)
+        connection.games.add(game)
+        return {'color': color, **game.state()}
+
+    def op_move(self, connection, request):
+        game = self.game(request)
+        position = game.position
+        if game.players[position.turn] is not connection:
+            raise ServerError('not your turn')
+        if position.game_over:
+            raise ServerError('game over')
+        if not isinstance(request.get('move'), str):
+            raise ServerError('move must be a string')
+        try:
+            move = parse_move(request['move'])
+        except ValueError as exc:
+            raise ServerError(str(exc)) from None
+        start, end, promotion = move
+        if promotion and move not in position.legal_moves():
+            raise ServerError('illegal move')
+        if not position.move_piece(square_pos(start), square_pos(end)):
+            raise ServerError('illegal move')
+        if position.promoting_pawn:
+            position.promote_pawn(PIECE_LETTERS[promotion or QUEEN])
+
+        self.moves_played += 1
+        game.unannounced.append(move_name(position.history[-1][0]))
+        self.dirty_games.add(game)
+        return {'ply': len(position.history)}
+
+    def op_state(self, connection, request):
+        return self.game(request).state()
+
+    def op_leave(self, connection, request):
+        self.leave(connection, self.game(request))
+        return {}
+
+    def leave(self, connection, game):
+        """Take connection out of game, and drop the game once nobody is left in it."""
+        for color, player in game.players.items():
+            if player is connection:
+                game.players[color] = None
+        game.watchers.discard(connection)
+        connection.games.discard(game)
+        if not game.connections():
+            self.games.pop(game.id, None)
+            self.dirty_games.discard(game)
+
+    def handle(self, connection, line):
+        """Answer one request line."""
+        reply_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise ServerError('invalid JSON') from None
+            if not isinstance(request, dict):
+                raise ServerError('a request must be a JSON object')
+            reply_id = request.get('id')
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            if handler is None:
+                raise ServerError(f"unknown op {request.get('op')!r}")
+            reply = {'type': 'ok', **handler(connection, request)}
+        except ServerError as exc:
+            reply = {'type': 'error', 'error': str(exc)}
+        if reply_id is not None:
+            reply['id'] = reply_id
+        self.send(connection, reply)
+
+    async def client(self, reader, writer):
+        """Serve one connection until it closes."""
+        connection = Connection(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    self.handle(connection, line)
+        finally:
+            for game in list(connection.games):
+                self.leave(connection, game)
+            self.dirty_connections.discard(connection)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, ready=None):
+        """Listen until cancelled; ready, if given, is called with the bound (host, port)."""
+        server = await asyncio.start_server(self.client, host, port)
+        async with server:
+            if ready:
+                ready(server.sockets[0].getsockname()[:2])
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve chess games over TCP as JSON lines.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    args = parser.parse_args(argv)
+
+    def ready(address):
+        print(f'listening on {address[0]}:{address[1]}', flush=True)
+
+    try:
+        asyncio.run(GameServer().serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,462 @@
+"""Endgame tablebases for up to four pieces, built by retrograde analysis.
+
+A table covers one material signature such as 'KQvK' or 'KRvKP', the
+stronger side listed first and playing white. Each position gets one byte:
+0 for a draw, 255 for a position that cannot occur, otherwise 1 + the
+number of plies to mate, odd plies meaning the side to move wins. The
+index is a direct product of piece squares after mirroring the white king
+into a canonical region (a1-d1-d4 without pawns, files a-d with them), so
+a probe is one index computation and one byte read from a mapped file.
+
+Generation starts from mates and walks backwards with un-moves, level by
+level, so distances come out minimal. Captures and promotions lead into
+smaller tables, which are generated first. Castling is not covered and en
+passant is ignored; the 50-move rule does not apply to the distances.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, SQUARE_INDEX, bishop_attacks, rook_attacks
+from rules import (
+    BISHOP, BLACK, COLOR_MASK, EMPTY, FEN_LETTERS, FEN_PIECES, KING, KNIGHT, PAWN, QUEEN, ROOK, SQUARES,
+    TYPE_MASK, WHITE, Position,
+)
+
+TABLE_MAGIC = b'XTBL'
+TABLE_VERSION = 1
+TABLE_HEADER = struct.Struct('<4sHH8sQ')
+DRAW = 0
+INVALID = 255
+MAX_PIECES = 4
+
+# Order of pieces within a side, and the material weights deciding which side is "stronger"
+KIND_ORDER = (KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+KIND_VALUES = {KING: 0, QUEEN: 9, ROOK: 5, BISHOP: 3, KNIGHT: 3, PAWN: 1}
+PAWN_ATTACKS_BY_SIDE = (PAWN_ATTACKS[WHITE], PAWN_ATTACKS[BLACK])
+PROMOTION_KINDS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+THREE_PIECE_TABLES = ['KQvK', 'KRvK', 'KBvK', 'KNvK', 'KPvK']
+
+
+def _square_map(function):
+    """Return the square table of a board symmetry given as a (row, col) function."""
+    return tuple(row * 8 + col for row, col in (function(sq >> 3, sq & 7) for sq in range(64)))
+
+
+def _symmetries(generators):
+    """Return every square table produced by composing the generator symmetries."""
+    found = {tuple(range(64))}
+    frontier = list(found)
+    while frontier:
+        table = frontier.pop()
+        for generator in generators:
+            composed = tuple(generator[table[sq]] for sq in range(64))
+            if composed not in found:
+                found.add(composed)
+                frontier.append(composed)
+    return sorted(found)
+
+
+MIRROR_FILES = _square_map(lambda row, col: (row, 7 - col))
+MIRROR_ROWS = _square_map(lambda row, col: (7 - row, col))
+MIRROR_DIAGONAL = _square_map(lambda row, col: (7 - col, 7 - row))
+PAWNLESS_SYMMETRIES = _symmetries([MIRROR_FILES, MIRROR_ROWS, MIRROR_DIAGONAL])
+PAWN_SYMMETRIES = _symmetries([MIRROR_FILES])
+# Squares the white king is mirrored into; row 7 is the first rank
+PAWNLESS_REGION = [sq for sq in range(64) if sq >> 3 >= 4 and sq & 7 <= 3 and (sq >> 3) + (sq & 7) >= 7]
+PAWN_REGION = [sq for sq in range(64) if sq & 7 <= 3]
+
+
+def side_key(kinds):
+    """Return a sort key ranking one side's material, stronger last."""
+    return sum(KIND_VALUES[kind] for kind in kinds), [-KIND_ORDER.index(kind) for kind in kinds]
+
+
+def sort_kinds(kinds):
+    """Return a side's piece kinds in signature order, king first."""
+    return sorted(kinds, key=KIND_ORDER.index)
+
+
+def make_signature(white, black):
+    """Return (signature, flipped) for two sides' kinds; flipped means black is the stronger side."""
+    white, black = sort_kinds(white), sort_kinds(black)
+    flipped = side_key(black) > side_key(white)
+    if flipped:
+        white, black = black, white
+    return ''.join(FEN_LETTERS[kind] for kind in white) + 'v' + ''.join(FEN_LETTERS[kind] for kind in black), flipped
+
+
+def parse_signature(signature):
+    """Return the (white kinds, black kinds) of a signature such as 'KRvKP'."""
+    try:
+        white, black = signature.upper().split('V')
+        white = [FEN_PIECES[letter] for letter in white]
+        black = [FEN_PIECES[letter] for letter in black]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid material signature '{signature}'") from None
+    if white.count(KING) != 1 or black.count(KING) != 1 or len(white) + len(black) > MAX_PIECES:
+        raise ValueError(f"Signature '{signature}' needs one king per side and at most {MAX_PIECES} pieces")
+    return sort_kinds(white), sort_kinds(black)
+
+
+def decode_value(value):
+    """Return ('win' | 'loss' | 'draw', plies to mate) for a stored byte, or None if invalid."""
+    if value == INVALID:
+        return None
+    if value == DRAW:
+        return 'draw', None
+    plies = value - 1
+    return ('win' if plies % 2 else 'loss'), plies
+
+
+def _attacks(kind, side, sq, occupancy):
+    """Return the squares attacked by a piece."""
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == KING:
+        return KING_ATTACKS[sq]
+    if kind == PAWN:
+        return PAWN_ATTACKS_BY_SIDE[side][sq]
+    if kind == BISHOP:
+        return bishop_attacks(sq, occupancy)
+    if kind == ROOK:
+        return rook_attacks(sq, occupancy)
+    return bishop_attacks(sq, occupancy) | rook_attacks(sq, occupancy)
+
+
+def _is_attacked(target, by_side, kinds, sides, squares):
+    """Check if square target is attacked by a side; captured pieces have square -1."""
+    occupancy = 0
+    for sq in squares:
+        if sq >= 0:
+            occupancy |= 1 << sq
+    bit = 1 << target
+    for kind, side, sq in zip(kinds, sides, squares):
+        if side == by_side and sq >= 0 and _attacks(kind, side, sq, occupancy) & bit:
+            return True
+    return False
+
+
+class Table:
+    """One material signature: its index and, once generated or loaded, its values."""
+
+    def __init__(self, signature, data=None):
+        white, black = parse_signature(signature)
+        self.signature = signature
+        self.kinds = [KING, KING] + white[1:] + black[1:]
+        self.sides = [0, 1] + [0] * (len(white) - 1) + [1] * (len(black) - 1)
+        self.pieces = len(self.kinds)
+        pawns = PAWN in self.kinds
+        self.region = PAWN_REGION if pawns else PAWNLESS_REGION
+        self.region_index = [-1] * 64
+        for index, sq in enumerate(self.region):
+            self.region_index[sq] = index
+        symmetries = PAWN_SYMMETRIES if pawns else PAWNLESS_SYMMETRIES
+        # The symmetries that bring a white king on each square into the region
+        self.king_symmetries = [[table for table in symmetries if self.region_index[table[sq]] >= 0]
+                                for sq in range(64)]
+        self.size = 2 * len(self.region) * 64 ** (self.pieces - 1)
+        self.data = data
+
+    def index(self, squares, side):
+        """Return the index of a position (squares in table order, side to move 0 or 1)."""
+        best = None
+        for table in self.king_symmetries[squares[0]]:
+            index = side * len(self.region) + self.region_index[table[squares[0]]]
+            for sq in squares[1:]:
+                index = index * 64 + table[sq]
+            if best is None or index < best:
+                best = index
+        return best
+
+    def decode(self, index):
+        """Return (squares, side to move) of an index."""
+        squares = []
+        for _ in range(self.pieces - 1):
+            squares.append(index & 63)
+            index >>= 6
+        side, region = divmod(index, len(self.region))
+        squares.append(self.region[region])
+        squares.reverse()
+        return squares, side
+
+    def value(self, squares, side):
+        """Return the stored byte of a position."""
+        return self.data[self.index(squares, side)]
+
+    def _is_legal(self, index, squares, side):
+        """Check that an index is the canonical form of a position that can occur."""
+        if len(set(squares)) != self.pieces:
+            return False
+        for kind, sq in zip(self.kinds, squares):
+            if kind == PAWN and sq >> 3 in (0, 7):
+                return False
+        if self.index(squares, side) != index:
+            return False
+        return not _is_attacked(squares[1 - side], side, self.kinds, self.sides, squares)
+
+    def _moves(self, squares, side):
+        """Yield (kinds, squares, internal) after each legal move of side.
+
+        Internal moves keep the material; captures and promotions return
+        the new kinds with the captured piece's square set to -1.
+        """
+        kinds = self.kinds
+        sides = self.sides
+        occupancy = own = 0
+        for piece_side, sq in zip(sides, squares):
+            occupancy |= 1 << sq
+            if piece_side == side:
+                own |= 1 << sq
+        king = side
+        for piece, (kind, piece_side, sq) in enumerate(zip(kinds, sides, squares)):
+            if piece_side != side:
+                continue
+            if kind == PAWN:
+                step = -8 if side == 0 else 8
+                targets = PAWN_ATTACKS_BY_SIDE[side][sq] & occupancy & ~own
+                if not occupancy >> (sq + step) & 1:
+                    targets |= 1 << (sq + step)
+                    if sq >> 3 == (6 if side == 0 else 1) and not occupancy >> (sq + 2 * step) & 1:
+                        targets |= 1 << (sq + 2 * step)
+            else:
+                targets = _attacks(kind, side, sq, occupancy) & ~own
+
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                to = low.bit_length() - 1
+                moved = squares[:]
+                moved[piece] = to
+                captured = False
+                if occupancy & low:
+                    moved[squares.index(to)] = -1
+                    captured = True
+                if _is_attacked(moved[king], 1 - side, kinds, sides, moved):
+                    continue
+                if kind == PAWN and to >> 3 in (0, 7):
+                    for promotion in PROMOTION_KINDS:
+                        promoted = kinds[:]
+                        promoted[piece] = promotion
+                        yield promoted, moved, False
+                else:
+                    yield kinds, moved, not captured
+
+    def _unmoves(self, squares, side):
+        """Yield the squares of every position from which the side not to move reached this one."""
+        mover = 1 - side
+        occupancy = 0
+        for sq in squares:
+            occupancy |= 1 << sq
+        empty = ~occupancy
+        for piece, (kind, piece_side, sq) in enumerate(zip(self.kinds, self.sides, squares)):
+            if piece_side != mover:
+                continue
+            if kind == PAWN:
+                back = 8 if mover == 0 else -8
+                origins = 0
+                if empty >> (sq + back) & 1:
+                    origins = 1 << (sq + back)
+                    if sq >> 3 == (4 if mover == 0 else 3) and empty >> (sq + 2 * back) & 1:
+                        origins |= 1 << (sq + 2 * back)
+            else:
+                origins = _attacks(kind, mover, sq, occupancy) & empty
+            while origins:
+                low = origins & -origins
+                origins ^= low
+                before = squares[:]
+                before[piece] = low.bit_length() - 1
+                yield before
+
+    def generate(self, tablebase, progress=None):
+        """Compute every value, looking captures and promotions up in tablebase."""
+        size = self.size
+        values = bytearray(size)
+        pending = bytearray(size)
+        longest = bytearray(size)
+        wins = {}
+        losses = {}
+
+        for index in range(size):
+            squares, side = self.decode(index)
+            if not self._is_legal(index, squares, side):
+                values[index] = INVALID
+                continue
+            successors = set()
+            has_moves = draw_exit = False
+            best_win = None
+            for kinds, moved, internal in self._moves(squares, side):
+                has_moves = True
+                if internal:
+                    successors.add(self.index(moved, 1 - side))
+                    continue
+                pieces = [(kind, piece_side, sq) for kind, piece_side, sq in zip(kinds, self.sides, moved)
+                          if sq >= 0]
+                result = tablebase.lookup(pieces, 1 - side)
+                if result == DRAW:
+                    draw_exit = True
+                elif (result - 1) % 2 == 0:
+                    if best_win is None or result < best_win:
+                        best_win = result
+                else:
+                    longest[index] = max(longest[index], result - 1)
+
+            if not has_moves:
+                if _is_attacked(squares[side], 1 - side, self.kinds, self.sides, squares):
+                    losses.setdefault(0, []).append(index)
+                continue
+            if best_win is not None:
+                wins.setdefault(best_win, []).append(index)
+            # A drawing or winning way out keeps the position from ever counting as lost
+            pending[index] = len(successors) + (draw_exit or best_win is not None)
+            if not pending[index]:
+                losses.setdefault(longest[index] + 1, []).append(index)
+            if progress and index % 500000 == 0:
+                progress(f'{self.signature}: {index}/{size} positions set up')
+
+        plies = 0
+        while wins or losses:
+            resolved = []
+            for index in losses.pop(plies, ()):
+                if not values[index]:
+                    values[index] = plies + 1
+                    resolved.append(index)
+            for index in wins.pop(plies, ()):
+                if not values[index]:
+                    values[index] = plies + 1
+                    resolved.append(index)
+
+            for index in resolved:
+                squares, side = self.decode(index)
+                lost = plies % 2 == 0
+                for before in set(self.index(before, 1 - side) for before in self._unmoves(squares, side)):
+                    if values[before]:
+                        continue
+                    if lost:
+                        wins.setdefault(plies + 1, []).append(before)
+                    else:
+                        pending[before] -= 1
+                        longest[before] = max(longest[before], plies)
+                        if not pending[before]:
+                            losses.setdefault(longest[before] + 1, []).append(before)
+            if progress and resolved:
+                progress(f'{self.signature}: {len(resolved)} positions at {plies} plies')
+            plies += 1
+            if plies >= INVALID - 1:
+                raise ValueError(f'{self.signature}: distance to mate does not fit in a byte')
+
+        self.data = values
+        return self
+
+    def save(self, path):
+        with open(path, 'wb') as out:
+            out.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, self.pieces,
+                                        self.signature.encode('ascii'), self.size))
+            out.write(self.data)
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved table read-only."""
+        with open(path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, signature, size = TABLE_HEADER.unpack_from(data)
+        table = cls(signature.rstrip(b'\0').decode('ascii'))
+        if magic != TABLE_MAGIC or version != TABLE_VERSION or size != table.size:
+            raise ValueError(f"'{path}' is not a tablebase of version {TABLE_VERSION}")
+        table.data = memoryview(data)[TABLE_HEADER.size:]
+        return table
+
+
+class Tablebase:
+    """The tables of one directory, loaded on first use (and generated on demand if asked)."""
+
+    def __init__(self, directory, generate=False, progress=None):
+        self.directory = directory
+        self.generate = generate
+        self.progress = progress
+        self.tables = {}
+
+    def path(self, signature):
+        return os.path.join(self.directory, signature + '.xtb')
+
+    def table(self, signature):
+        """Return the Table of a signature, or None when it is not available."""
+        if signature not in self.tables:
+            path = self.path(signature)
+            if os.path.isfile(path):
+                self.tables[signature] = Table.load(path)
+            elif self.generate:
+                start = time.perf_counter()
+                table = Table(signature).generate(self, self.progress)
+                os.makedirs(self.directory, exist_ok=True)
+                table.save(path)
+                if self.progress:
+                    self.progress(f'{signature}: {table.size} entries in {time.perf_counter() - start:.1f}s')
+                self.tables[signature] = table
+            else:
+                self.tables[signature] = None
+        return self.tables[signature]
+
+    def lookup(self, pieces, side):
+        """Return the stored byte for (kind, side, square) pieces with side to move, or None."""
+        if len(pieces) == 2:
+            return DRAW
+        white = [kind for kind, piece_side, _ in pieces if piece_side == 0]
+        black = [kind for kind, piece_side, _ in pieces if piece_side == 1]
+        signature, flipped = make_signature(white, black)
+        table = self.table(signature)
+        if table is None:
+            return None
+        if flipped:
+            pieces = [(kind, 1 - piece_side, sq ^ 56) for kind, piece_side, sq in pieces]
+            side = 1 - side
+        pieces = sorted(pieces, key=lambda piece: (piece[0] != KING, piece[1], KIND_ORDER.index(piece[0])))
+        return table.value([sq for _, _, sq in pieces], side)
+
+    def probe(self, position):
+        """Return ('win' | 'loss' | 'draw', plies to mate) for the side to move, or None if not covered."""
+        if position.castling:
+            return None
+        pieces = []
+        for sq in SQUARES:
+            piece = position.board[sq]
+            if piece != EMPTY:
+                pieces.append((piece & TYPE_MASK, (piece & COLOR_MASK) // BLACK, SQUARE_INDEX[sq]))
+                if len(pieces) > MAX_PIECES:
+                    return None
+        value = self.lookup(pieces, 0 if position.turn == 'b' else 1)
+        return None if value is None else decode_value(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate and probe endgame tablebases.')
+    parser.add_argument('--dir', default='tablebases', help='directory holding the tables')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='build tables and the smaller ones they lead to')
+    generate.add_argument('signatures', nargs='*', help="material such as KQvK or KRvKP (default: all 3-piece)")
+    probe = commands.add_parser('probe', help='look a position up')
+    probe.add_argument('fen')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        tablebase = Tablebase(args.dir, generate=True, progress=lambda message: print(message, file=sys.stderr))
+        for signature in args.signatures or THREE_PIECE_TABLES:
+            white, black = parse_signature(signature)
+            tablebase.table(make_signature(white, black)[0])
+        return 0
+
+    result = Tablebase(args.dir).probe(Position.from_fen(args.fen))
+    if result is None:
+        print('not covered')
+        return 1
+    outcome, plies = result
+    print(outcome if plies is None else f'{outcome} in {plies} plies ({(plies + 1) // 2} moves)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
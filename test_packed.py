@@ -0,0 +1,87 @@
+"""Tests of the packed position and game files."""
+import os
+import random
+import tempfile
+import unittest
+
+from packed import (
+    POSITION_SIZE, GameFile, GameWriter, PositionFile, PositionWriter, decode_move, encode_move,
+    pack_position, unpack_position,
+)
+from pgn import Game
+from rules import START_FEN, Position, parse_move
+
+FENS = [
+    START_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 12 40',
+]
+
+
+def random_game(rng, fen=START_FEN, plies=80):
+    position = Position.from_fen(fen)
+    while not position.game_over and len(position.history) < plies:
+        position.play_move(rng.choice(position.legal_moves()))
+    return Game.from_position(position)
+
+
+class PackedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_position_record_round_trip(self):
+        for fen in FENS:
+            record = pack_position(Position.from_fen(fen))
+            self.assertEqual(len(record), POSITION_SIZE)
+            position = unpack_position(record)
+            self.assertEqual(position.to_fen(), fen)
+            self.assertEqual(position.hash, position.compute_hash())
+
+    def test_move_index_round_trip(self):
+        position = Position.from_fen(FENS[1])
+        for move in position.legal_moves():
+            self.assertEqual(decode_move(position, encode_move(position, move)), move)
+
+    def test_position_file(self):
+        with PositionWriter(self.path('p.xpos')) as writer:
+            for fen in FENS:
+                writer.write(Position.from_fen(fen))
+        with PositionFile(self.path('p.xpos')) as positions:
+            self.assertEqual(len(positions), len(FENS))
+            self.assertEqual([position.to_fen() for position in positions], FENS)
+            self.assertEqual(positions[2].to_fen(), FENS[2])
+
+    def test_game_file(self):
+        rng = random.Random(3)
+        games = [random_game(rng, FENS[index % len(FENS)]) for index in range(12)]
+        with GameWriter(self.path('g.xgm')) as writer:
+            for game in games:
+                writer.write_game(game)
+        with GameFile(self.path('g.xgm')) as stored:
+            self.assertEqual(len(stored), len(games))
+            for index in reversed(range(len(games))):
+                game = stored[index]
+                self.assertEqual(game.moves, games[index].moves)
+                self.assertEqual(game.result, games[index].result)
+                self.assertEqual(game.start_position().to_fen(), games[index].start_position().to_fen())
+
+    def test_illegal_move_writes_nothing(self):
+        with GameWriter(self.path('g.xgm')) as writer:
+            writer.write([parse_move('e2e4')], '*')
+            with self.assertRaises(ValueError):
+                writer.write([parse_move('d2d4'), parse_move('d2d4')], '1-0', FENS[1])
+            writer.write([parse_move('d2d4')], '1-0')
+        with GameFile(self.path('g.xgm')) as stored:
+            self.assertEqual(len(stored), 2)
+            self.assertEqual(stored.moves(0), [parse_move('e2e4')])
+            self.assertEqual(stored.moves(1), [parse_move('d2d4')])
+            self.assertEqual(stored[1].result, '1-0')
+
+
+if __name__ == '__main__':
+    unittest.main()
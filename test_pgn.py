@@ -0,0 +1,84 @@
+"""Tests of the PGN reader and writer."""
+import io
+import random
+import unittest
+
+from pgn import Game, game_to_pgn, move_to_san, parse_san, read_games, write_game
+from rules import Position, parse_move
+
+PGN = '''[Event "Ruy Lopez"]
+[White "A"]
+[Black "B"]
+[Result "1-0"]
+
+1. e4 {a comment
+[Event "not a tag"]} e5 2. Nf3 (2. f4 exf4 (2... d5) 3. Nf3) 2... Nc6 $1 3. Bb5 a6; to the end of the line
+4. Ba4 Nf6 5. O-O Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O 1-0
+
+[Event "Promotion"]
+[SetUp "1"]
+[FEN "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"]
+
+1. a8=Q+ Kd7 2. Qb7+ Kd6 *
+'''
+
+
+def read(text):
+    return list(read_games(io.StringIO(text)))
+
+
+class ReadGamesTest(unittest.TestCase):
+    def test_reads_games_skipping_comments_and_variations(self):
+        first, second = read(PGN)
+        self.assertEqual(first.headers['Event'], 'Ruy Lopez')
+        self.assertEqual(len(first.moves), 16)
+        self.assertEqual(first.result, '1-0')
+        self.assertIsNone(first.error)
+        self.assertEqual(first.moves[:2], [parse_move('e2e4'), parse_move('e7e5')])
+        self.assertEqual(second.moves[0], parse_move('a7a8q'))
+        self.assertEqual(second.end_position().to_fen(), '8/1Q6/3k4/8/8/8/8/4K3 w - - 3 3')
+
+    def test_headers_only(self):
+        games = list(read_games(io.StringIO(PGN), parse_moves=False))
+        self.assertEqual([game.result for game in games], ['1-0', '*'])
+        self.assertEqual([game.moves for game in games], [[], []])
+
+    def test_illegal_move_keeps_the_moves_before_it(self):
+        [game] = read('[Event "Bad"]\n\n1. e4 e5 2. Ke3 Nc6 *\n')
+        self.assertEqual(game.moves, [parse_move('e2e4'), parse_move('e7e5')])
+        self.assertIn("Illegal move 'Ke3' at ply 3", game.error)
+        # Writing such a game back keeps the legal prefix
+        [again] = read(game_to_pgn(game))
+        self.assertEqual(again.moves, game.moves)
+        self.assertIsNone(again.error)
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_read_write_read(self):
+        out = io.StringIO()
+        for game in read(PGN):
+            write_game(game, out)
+        for before, after in zip(read(PGN), read(out.getvalue()), strict=True):
+            self.assertEqual(after.moves, before.moves)
+            self.assertEqual(after.result, before.result)
+            self.assertEqual(after.headers.get('FEN'), before.headers.get('FEN'))
+
+    def test_random_games(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            position = Position()
+            while not position.game_over and len(position.history) < 120:
+                position.play_move(rng.choice(position.legal_moves()))
+            game = Game.from_position(position)
+            [again] = read(game_to_pgn(game))
+            self.assertEqual(again.moves, game.moves)
+            self.assertEqual(again.result, game.result)
+
+    def test_san_of_every_legal_move_parses_back(self):
+        position = Position.from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        for move in position.legal_moves():
+            self.assertEqual(parse_san(position, move_to_san(position, move)), move)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests of FEN loading and export in rules.py."""
+import unittest
+
+from rules import START_FEN, Position, parse_square
+
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+def snapshot(position):
+    return (bytes(position.board), dict(position.king_positions), position.turn, position.castling,
+            position.ep_square, position.halfmove_clock, position.fullmove_number, position.hash,
+            len(position.history))
+
+
+class LoadFenTest(unittest.TestCase):
+    def test_round_trip(self):
+        for fen in (START_FEN, KIWIPETE, '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                    'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3'):
+            self.assertEqual(Position.from_fen(fen).to_fen(), fen)
+
+    def test_optional_fields(self):
+        position = Position.from_fen('4k3/8/8/8/8/8/8/4K3')
+        self.assertEqual(position.to_fen(), '4k3/8/8/8/8/8/8/4K3 w - - 0 1')
+
+    def test_ep_square_kept_only_when_a_pawn_can_take(self):
+        self.assertEqual(Position.from_fen('4k3/8/8/8/4P3/8/8/4K3 b - e3 0 1').ep_square, 0)
+        position = Position.from_fen('4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1')
+        self.assertEqual(position.ep_square, parse_square('e3'))
+
+    def test_rejects_bad_fields(self):
+        bad = [
+            '',
+            START_FEN + ' extra',
+            'rnbqkbnr/pppppppp/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqkbnr/pppppppp/0/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqkbnr/ppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNRR w KQkq - 0 1',
+            'rnbqkbnr/pppppppp/8/8/8/8/PPPXPPPP/RNBQKBNR w KQkq - 0 1',
+            'Pnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqqbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+            'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBKKBNR w KQkq - 0 1',
+            START_FEN.replace(' w ', ' x '),
+            '4k3/8/8/8/8/8/8/4K2R w Kx - 0 1',
+            '4k3/4R3/8/8/8/8/8/4K3 w - - 0 1',
+            '4k3/8/8/8/3pP3/8/8/4K3 b - e4 0 1',
+            '4k3/8/8/8/3pP3/8/8/4K3 b - i3 0 1',
+            '4k3/8/8/8/3p4/8/8/4K3 b - e3 0 1',
+            '4k3/8/8/8/3pP3/8/4P3/4K3 b - e3 0 1',
+            '4k3/8/8/8/8/8/8/4K3 w - - x 1',
+            '4k3/8/8/8/8/8/8/4K3 w - - -1 1',
+            '4k3/8/8/8/8/8/8/4K3 w - - 0 0',
+            '4k3/8/8/8/8/8/8/4K3 w - - 0 one',
+        ]
+        for fen in bad:
+            with self.subTest(fen=fen), self.assertRaises(ValueError):
+                Position.from_fen(fen)
+
+    def test_rejected_fen_leaves_position_unchanged(self):
+        position = Position.from_fen(KIWIPETE)
+        position.play_move(position.legal_moves()[0])
+        before = snapshot(position)
+        for fen in ('8/8/8/8/8/8/8/4K3 w - - 0 1',
+                    '4k3/4R3/8/8/8/8/8/4K3 w - - 0 1',
+                    '4k3/8/8/8/3pP3/8/8/4K3 b - e4 0 1',
+                    '4k3/8/8/8/8/8/8/4K3 w - - 0 0'):
+            with self.subTest(fen=fen):
+                with self.assertRaises(ValueError):
+                    position.load_fen(fen)
+                self.assertEqual(snapshot(position), before)
+        self.assertEqual(position.hash, position.compute_hash())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Loopback tests of the JSON lines protocol in server.py."""
+import asyncio
+import json
+import unittest
+
+from rules import START_FEN
+from server import GameServer
+
+TIMEOUT = 5
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.updates = []
+
+    async def send_line(self, line):
+        self.writer.write(line.encode() + b'\n')
+        await self.writer.drain()
+
+    async def request(self, message):
+        """Send a request and return its reply, keeping the updates that arrive before it."""
+        self.next_id += 1
+        message['id'] = self.next_id
+        await self.send_line(json.dumps(message))
+        while True:
+            reply = await self.read()
+            if reply.get('id') == self.next_id:
+                return reply
+            self.updates.append(reply)
+
+    async def read(self):
+        line = await asyncio.wait_for(self.reader.readline(), TIMEOUT)
+        if not line:
+            raise ConnectionError('server closed the connection')
+        return json.loads(line)
+
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = GameServer()
+        bound = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self.server.serve('127.0.0.1', 0, bound.set_result))
+        self.address = await asyncio.wait_for(bound, TIMEOUT)
+        self.clients = []
+
+    async def asyncTearDown(self):
+        for client in self.clients:
+            client.writer.close()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def connect(self):
+        client = Client(*await asyncio.open_connection(*self.address))
+        self.clients.append(client)
+        return client
+
+    async def assert_error(self, client, message, error):
+        reply = await client.request(message)
+        self.assertEqual(reply['type'], 'error', reply)
+        self.assertIn(error, reply['error'])
+
+    async def test_game_messages(self):
+        white, black, watcher = await self.connect(), await self.connect(), await self.connect()
+        reply = await white.request({'op': 'new'})
+        self.assertEqual(reply['type'], 'ok')
+        self.assertEqual((reply['color'], reply['fen']), ('b', START_FEN))
+        game = reply['game']
+
+        self.assertEqual((await black.request({'op': 'join', 'game': game}))['color'], 'p')
+        self.assertIsNone((await watcher.request({'op': 'join', 'game': game}))['color'])
+
+        reply = await white.request({'op': 'move', 'game': game, 'move': 'e2e4'})
+        self.assertEqual((reply['type'], reply['ply']), ('ok', 1))
+        update = await watcher.read()
+        self.assertEqual((update['type'], update['moves'], update['turn']), ('update', ['e2e4'], 'p'))
+
+        await self.assert_error(white, {'op': 'move', 'game': game, 'move': 'd2d4'}, 'not your turn')
+        await self.assert_error(black, {'op': 'move', 'game': game, 'move': 'e7e4'}, 'illegal move')
+
+        reply = await black.request({'op': 'state', 'game': game})
+        self.assertEqual((reply['ply'], reply['turn'], reply['game_over']), (1, 'p', False))
+
+        self.assertEqual((await black.request({'op': 'leave', 'game': game}))['type'], 'ok')
+        self.assertIsNone(self.server.games[game].players['p'])
+
+    async def test_game_over(self):
+        client = await self.connect()
+        game = (await client.request({'op': 'new', 'fen': '7k/5Q2/6K1/8/8/8/8/8 w - - 0 1'}))['game']
+        await client.request({'op': 'join', 'game': game})
+        reply = await client.request({'op': 'move', 'game': game, 'move': 'f7g7'})
+        self.assertEqual(reply['type'], 'ok')
+        state = await client.request({'op': 'state', 'game': game})
+        self.assertEqual((state['game_over'], state['result']), (True, '1-0'))
+        await self.assert_error(client, {'op': 'move', 'game': game, 'move': 'h8g7'}, 'game over')
+
+    async def test_bad_requests(self):
+        client = await self.connect()
+        game = (await client.request({'op': 'new'}))['game']
+        await self.assert_error(client, {'op': 'fly'}, 'unknown op')
+        await self.assert_error(client, {'op': 'new', 'fen': 'not a fen'}, 'bad fen')
+        await self.assert_error(client, {'op': 'state', 'game': game + 1}, 'unknown game')
+        await self.assert_error(client, {'op': 'move', 'game': game, 'move': 'e2'}, "Invalid move 'e2'")
+
+        await client.send_line('{not json')
+        self.assertEqual(await client.read(), {'type': 'error', 'error': 'invalid JSON'})
+        await client.send_line('[1, 2]')
+        self.assertEqual((await client.read())['type'], 'error')
+
+    async def test_wrongly_typed_fields(self):
+        client = await self.connect()
+        game = (await client.request({'op': 'new'}))['game']
+        for fen in (7, ['x'], {'fen': START_FEN}, True):
+            with self.subTest(fen=fen):
+                await self.assert_error(client, {'op': 'new', 'fen': fen}, 'fen must be a string')
+        for game_id in (True, str(game), float(game), [game], None):
+            with self.subTest(game=game_id):
+                await self.assert_error(client, {'op': 'state', 'game': game_id}, 'unknown game')
+        for move in (None, 1234, ['e2e4'], {'from': 'e2'}):
+            with self.subTest(move=move):
+                await self.assert_error(client, {'op': 'move', 'game': game, 'move': move},
+                                        'move must be a string')
+        # The server still answers after every refusal
+        self.assertEqual((await client.request({'op': 'state', 'game': game}))['ply'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()